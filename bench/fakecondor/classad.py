@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Stand-in for the classad python bindings used by the benchmark suite.
+
+Only what the tools touch is provided: ExprTree, ClassAd, Value.Undefined and enough
+of the ClassAd expression language (comparisons, &&, ||, !, regexp(),
+string(), meta-equality) to evaluate the constraints the tools generate."""
+from __future__ import division
+from __future__ import print_function
+import re
+
+class Value(object):
+    pass
+
+Value.Undefined = Value()
+Value.Error = Value()
+
+_token = re.compile(r'''\s*(?:
+                        ("(?:\\.|[^"\\])*")                     # string
+                        |(\d+\.\d*|\d+)                         # number
+                        |([A-Za-z_][A-Za-z0-9_]*)               # identifier
+                        |(=\?=|=!=|==|!=|<=|>=|&&|\|\||[-+*/<>!(),])  # operator
+                    )''', re.VERBOSE)
+
+_operators = {'&&': ' and ', '||': ' or ', '!': ' not ', '=?=': '==', '=!=': '!='}
+_literals = {'true': 'True', 'false': 'False', 'undefined': 'None'}
+
+def _attr(ad, name):
+    try:
+        return ad[name]
+    except KeyError:
+        lname = name.lower()
+        for k in ad:
+            if k.lower() == lname:
+                return ad[k]
+        return None
+
+def _regexp(pattern, target, options=''):
+    if target is None:
+        return False
+    return re.search(pattern, str(target), re.I if 'i' in options.lower() else 0) is not None
+
+def _string(v):
+    return (None if v is None else str(v))
+
+_functions = {'regexp': '_regexp', 'string': '_string', 'int': 'int', 'real': 'float'}
+_namespace = {'_attr': _attr, '_regexp': _regexp, '_string': _string}
+
+def _translate(expr):
+    """Translate a ClassAd expression to an equivalent Python expression"""
+    out = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = _token.match(expr, pos)
+        if not m:
+            raise SyntaxError('Unparsable ClassAd expression at %r' % expr[pos:])
+        pos = m.end()
+        string, number, ident, op = m.groups()
+        if string or number:
+            out.append(string or number)
+        elif ident:
+            nxt = _token.match(expr, pos)
+            if nxt and nxt.group(4) == '(':
+                if ident.lower() not in _functions:
+                    raise SyntaxError('Unsupported ClassAd function %s' % ident)
+                out.append(_functions[ident.lower()])
+            elif ident.lower() in _literals:
+                out.append(_literals[ident.lower()])
+            else:
+                out.append('_attr(ad, %r)' % ident)
+        else:
+            out.append(_operators.get(op, op))
+    return ''.join(out) or 'True'
+
+class ExprTree(object):
+    _cache = {}
+
+    def __init__(self, expr):
+        self.expr = str(expr)
+        try:
+            self._func = self._cache[self.expr]
+        except KeyError:
+            code = 'lambda ad: (%s)' % _translate(self.expr)
+            self._func = self._cache[self.expr] = eval(code, dict(_namespace))
+
+    def __repr__(self):
+        return self.expr
+
+    def eval(self, ad=None):
+        try:
+            return self._func(ad or {})
+        except (TypeError, ZeroDivisionError):
+            return Value.Error
+
+    def matches(self, ad):
+        return self.eval(ad) is True
+
+class ClassAd(dict):
+    def eval(self, attr):
+        value = self[attr]
+        return (value.eval(self) if isinstance(value, ExprTree) else value)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Stand-in for the htcondor python bindings used by the benchmark suite.
+
+Schedd, Collector and Negotiator serve ads from synth.Pool, configured with
+FAKECONDOR_* environment variables. Constraints are evaluated and projections
+applied, so the tools do the same amount of work they would against a real
+pool of the same shape (minus the network)."""
+from __future__ import division
+from __future__ import print_function
+import classad
+import synth
+
+class AdTypes(object):
+    Startd = 'Startd'
+    Schedd = 'Schedd'
+    Negotiator = 'Negotiator'
+
+class DaemonTypes(object):
+    Schedd = 'Schedd'
+    Negotiator = 'Negotiator'
+
+param = {'MAX_DAGS_RUNNING': '1000'}
+
+_pool = synth.Pool.from_env()
+
+def _select(ads, constraint, projection):
+    ftr = classad.ExprTree(constraint or 'true')
+    projection = list(projection or [])
+    for ad in ads:
+        if ftr.matches(ad):
+            if projection:
+                # attribute names are case-insensitive, as in real ClassAds
+                values = ((a, classad._attr(ad, a)) for a in projection)
+                yield dict((a, v) for a,v in values if v is not None)
+            else:
+                yield dict(ad)
+
+class Schedd(object):
+    def __init__(self, location=None):
+        self.location = location
+
+    def xquery(self, requirements='true', projection=[]):
+        return _select(_pool.job_ads(), requirements, projection)
+
+    def query(self, constraint='true', attr_list=[]):
+        return list(self.xquery(constraint, attr_list))
+
+class Collector(object):
+    def __init__(self, pool=None):
+        self.pool = pool
+
+    def locate(self, daemon_type, name=None):
+        return {'Name': name or 'submit.%s' % synth.DOMAIN, 'MyType': daemon_type}
+
+    def locateAll(self, daemon_type):
+        return [{'Name': 'submit.%s' % synth.DOMAIN, 'MyType': daemon_type}]
+
+    def query(self, ad_type=AdTypes.Startd, constraint='', projection=[]):
+        if ad_type != AdTypes.Startd:
+            return []
+        return list(_select(_pool.slot_ads(), constraint, projection))
+
+class Negotiator(object):
+    def __init__(self, ad=None):
+        self.ad = ad
+
+    def getPriorities(self, rollup=False):
+        return _pool.priorities()
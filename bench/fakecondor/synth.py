@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""Synthetic HTCondor pool: job ads, slot ads, priorities and journals.
+
+Everything is derived deterministically from a handful of parameters, so the
+fake htcondor bindings (running inside the tool being benchmarked) and the
+benchmark driver (writing journals, counting expected output) agree on the
+same pool without exchanging any data other than the FAKECONDOR_* variables.
+"""
+from __future__ import division
+from __future__ import print_function
+import os
+import random
+import sys
+from time import time
+
+DOMAIN = 'icecube.wisc.edu'
+
+_params = ('jobs', 'users', 'groups', 'seed', 'now')
+
+# (value, weight) pairs roughly modeled on a busy submit node
+_job_status = ((1, 55), (2, 38), (5, 5), (4, 2))
+_req_memory = ((1000, 30), (2000, 35), (4000, 20), (8000, 10), (16000, 4), (64000, 1))
+_req_cpus = ((1, 80), (2, 8), (4, 7), (8, 4), (16, 1))
+_req_disk = ((10**6, 50), (2*10**6, 25), (10**7, 20), (10**8, 5))
+_req_gpus = ((0, 95), (1, 4), (2, 1))
+
+def _weighted(rng, pairs):
+    total = sum(w for v,w in pairs)
+    pick = rng.uniform(0, total)
+    for v,w in pairs:
+        pick -= w
+        if pick <= 0:
+            return v
+    return pairs[-1][0]
+
+class Pool(object):
+    """Synthetic pool of <jobs> jobs owned by <users> users in <groups> groups.
+
+    Users are assigned to groups round-robin; every (groups+1)-th user has no
+    accounting group. Job counts per user follow a Zipf-like distribution so
+    that a few users own most of the queue, as is typical."""
+    def __init__(self, jobs=1000, users=20, groups=4, seed=0, now=None):
+        self.jobs = int(jobs)
+        self.users = int(users)
+        self.groups = int(groups)
+        self.seed = int(seed)
+        self.now = int(now if now is not None else time())
+        self.group_names = ['group%d' % g for g in range(self.groups)]
+        self.user_names = ['user%03d' % u for u in range(self.users)]
+        self._job_ads = None
+        self._slot_ads = None
+
+    @classmethod
+    def from_env(cls, environ=None):
+        environ = (os.environ if environ is None else environ)
+        kwargs = {}
+        for p in _params:
+            var = 'FAKECONDOR_' + p.upper()
+            if var in environ:
+                kwargs[p] = environ[var]
+        return cls(**kwargs)
+
+    def to_env(self):
+        return dict(('FAKECONDOR_' + p.upper(), str(getattr(self, p))) for p in _params)
+
+    def user_group(self, user_idx):
+        if self.groups == 0 or user_idx % (self.groups + 1) == self.groups:
+            return None
+        return self.group_names[user_idx % (self.groups + 1)]
+
+    def quota(self, group):
+        return 100 * (self.group_names.index(group) + 1)
+
+    def condor_config(self):
+        """HTCondor configuration defining the groups of the pool"""
+        lines = ['GROUP_NAMES = ' + ', '.join(self.group_names)]
+        lines.extend('GROUP_QUOTA_%s = %s' % (g, self.quota(g)) for g in self.group_names)
+        return '\n'.join(lines) + '\n'
+
+    def _owners(self, rng, count):
+        weights = [1/(u + 1) for u in range(self.users)]
+        total = sum(weights)
+        owners = []
+        for u,w in enumerate(weights):
+            owners.extend([u] * int(round(count * w / total)))
+        while len(owners) < count:
+            owners.append(rng.randrange(self.users))
+        return owners[:count]
+
+    def job_ads(self):
+        """List of job ads as dicts; generated once and cached"""
+        if self._job_ads is not None:
+            return self._job_ads
+        rng = random.Random(self.seed)
+        ads = []
+        cluster = 1000
+        owners = self._owners(rng, self.jobs)
+        idx = 0
+        while idx < len(owners):
+            user = owners[idx]
+            size = 1
+            limit = min(rng.randint(1, 50), len(owners) - idx)
+            while size < limit and owners[idx + size] == user:
+                size += 1
+            cluster += 1
+            for proc in range(size):
+                ads.append(self._job_ad(rng, cluster, proc, user))
+            idx += size
+        self._job_ads = ads
+        return ads
+
+    def _job_ad(self, rng, cluster, proc, user_idx):
+        owner = self.user_names[user_idx]
+        group = self.user_group(user_idx)
+        status = _weighted(rng, _job_status)
+        universe = (7 if rng.random() < 0.02 else 5)
+        if universe == 7:
+            status = 2
+        qdate = self.now - int(rng.expovariate(1/86400)) - 1
+        ad = {
+            'ClusterId': cluster,
+            'ProcId': proc,
+            'JobId': '%s.%s' % (cluster, proc),
+            'Owner': owner,
+            'JobStatus': status,
+            'JobUniverse': universe,
+            'QDate': qdate,
+            'EnteredCurrentStatus': qdate,
+            'NumJobStarts': 0,
+            'RequestMemory': _weighted(rng, _req_memory),
+            'RequestCpus': _weighted(rng, _req_cpus),
+            'RequestDisk': _weighted(rng, _req_disk),
+            'Requestgpus': _weighted(rng, _req_gpus),
+        }
+        if group is not None:
+            ad['AccountingGroup'] = '%s.%s' % (group, owner)
+        if status in (2, 4) or (status == 5 and rng.random() < 0.5):
+            ad['NumJobStarts'] = (1 if rng.random() < 0.9 else rng.randint(2, 10))
+        if status == 2:
+            start = rng.randint(qdate, self.now)
+            runtime = max(self.now - start, 1)
+            rss = int(ad['RequestMemory'] * 1000 * rng.uniform(0.1, 1.2))
+            ad.update({
+                'EnteredCurrentStatus': start,
+                'JobCurrentStartDate': start,
+                'RemoteHost': self.host_slot(rng.randrange(self.hosts), cluster, proc),
+                'ResidentSetSize_RAW': rss,
+                'ImageSize_RAW': int(rss * rng.uniform(1.0, 1.3)),
+                'DiskUsage_RAW': int(ad['RequestDisk'] * rng.uniform(0.01, 1.1)),
+                'RemoteUserCpu': runtime * ad['RequestCpus'] * rng.uniform(0.3, 1.0),
+                'RemoteSysCpu': runtime * rng.uniform(0.0, 0.05),
+            })
+        elif status == 5:
+            ad['EnteredCurrentStatus'] = rng.randint(qdate, self.now)
+            ad['HoldReason'] = 'Job has gone over memory limit'
+        return ad
+
+    @property
+    def hosts(self):
+        return max(1, self.jobs // 40)
+
+    def host_name(self, host_idx):
+        return 'node%04d.%s' % (host_idx, DOMAIN)
+
+    def host_slot(self, host_idx, cluster, proc):
+        return 'slot1_%s@%s' % ((cluster * 7 + proc) % 64 + 1, self.host_name(host_idx))
+
+    def slot_ads(self):
+        """List of startd ads: one dynamic slot per running job and one
+        partitionable slot per host"""
+        if self._slot_ads is not None:
+            return self._slot_ads
+        rng = random.Random(self.seed + 1)
+        ads = []
+        for host in range(self.hosts):
+            ads.append({
+                'Name': 'slot1@%s' % self.host_name(host),
+                'Machine': self.host_name(host),
+                'State': 'Unclaimed', 'Activity': 'Idle',
+                'EnteredCurrentState': self.now - rng.randint(60, 10**6),
+                'ImageSize': 0, 'Memory': rng.choice((16000, 64000, 256000)),
+                'LoadAvg': 0.0, 'Cpus': rng.choice((0, 2, 8)),
+                'GPUs': rng.choice((0, 0, 0, 4)), 'Disk': rng.randint(10**7, 10**9),
+            })
+        for job in self.job_ads():
+            if job['JobStatus'] != 2 or 'RemoteHost' not in job:
+                continue
+            owner = job['Owner']
+            ad = {
+                'Name': job['RemoteHost'],
+                'Machine': job['RemoteHost'].split('@')[-1],
+                'State': 'Claimed', 'Activity': 'Busy',
+                'RemoteUser': '%s@%s' % (owner, DOMAIN),
+                'JobId': job['JobId'],
+                'EnteredCurrentState': job['EnteredCurrentStatus'],
+                'ImageSize': job['ImageSize_RAW'],
+                'Memory': job['RequestMemory'],
+                'LoadAvg': job['RequestCpus'] * rng.uniform(0.2, 1.3),
+                'Cpus': job['RequestCpus'],
+                'GPUs': job['Requestgpus'],
+                'Disk': job['RequestDisk'],
+            }
+            if 'AccountingGroup' in job:
+                ad['AccountingGroup'] = job['AccountingGroup']
+            ads.append(ad)
+        self._slot_ads = ads
+        return ads
+
+    def priorities(self):
+        """Negotiator priority records, one per submitter and group"""
+        rng = random.Random(self.seed + 2)
+        prios = []
+        for group in self.group_names:
+            prios.append({'Name': '%s@%s' % (group, DOMAIN), 'AccountingGroup': group,
+                            'IsAccountingGroup': True, 'Priority': 0.5,
+                            'ResourcesUsed': 0})
+        for u,user in enumerate(self.user_names):
+            group = self.user_group(u)
+            name = ('%s.%s@%s' % (group, user, DOMAIN) if group
+                                else '%s@%s' % (user, DOMAIN))
+            prios.append({'Name': name, 'AccountingGroup': group or '<none>',
+                            'IsAccountingGroup': False,
+                            'Priority': rng.uniform(0.5, 10000),
+                            'ResourcesUsed': rng.randint(0, 500)})
+        return prios
+
+    def journal(self, jobs, first_cluster=None):
+        """Generate schedd journal (job_queue.log) lines for the full
+        Submitted -> Started -> Completed life cycle of <jobs> new
+        single-process clusters. Yields lines without newlines; every job
+        produces exactly three events visible to condor_watch."""
+        rng = random.Random(self.seed + 3)
+        cluster = (first_cluster or 10**6)
+        for n in range(int(jobs)):
+            cluster += 1
+            user = rng.randrange(self.users)
+            owner = self.user_names[user]
+            group = self.user_group(user)
+            gid = '0%s.-1' % cluster
+            jid = '%s.0' % cluster
+            now = int(time())
+            yield '105'
+            yield '101 %s Job Machine' % gid
+            yield '103 %s Owner "%s"' % (gid, owner)
+            if group:
+                yield '103 %s AccountingGroup "%s.%s"' % (gid, group, owner)
+            yield '103 %s QDate %s' % (gid, now)
+            yield '103 %s RequestMemory %s' % (gid, _weighted(rng, _req_memory))
+            yield '103 %s RequestCpus %s' % (gid, _weighted(rng, _req_cpus))
+            yield '103 %s RequestDisk %s' % (gid, _weighted(rng, _req_disk))
+            yield '101 %s Job Machine' % jid
+            yield '103 %s ProcId 0' % jid
+            yield '103 %s JobStatus 1' % jid
+            yield '106'
+            yield '105'
+            yield '103 %s LastJobStatus 1' % jid
+            yield '103 %s RemoteHost "%s"' % (jid,
+                                self.host_slot(rng.randrange(self.hosts), cluster, 0))
+            yield '103 %s JobCurrentStartDate %s' % (jid, now)
+            yield '103 %s NumJobStarts 1' % jid
+            yield '103 %s JobStatus 2' % jid
+            yield '106'
+            yield '105'
+            yield '103 %s LastJobStatus 2' % jid
+            yield '103 %s ExitCode 0' % jid
+            yield '103 %s ResidentSetSize_RAW %s' % (jid, rng.randint(10**5, 10**7))
+            yield '103 %s JobStatus 4' % jid
+            yield '106'
+            yield '105'
+            yield '102 %s' % jid
+            yield '102 %s' % gid
+            yield '106'
+
+def main():
+    pool = Pool.from_env()
+    for k,v in sorted(pool.to_env().items()):
+        print('%s=%s' % (k, v))
+    print('jobs', len(pool.job_ads()), 'slots', len(pool.slot_ads()))
+
+if __name__ == '__main__':
+    sys.exit(main())
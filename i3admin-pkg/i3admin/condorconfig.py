@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+"""HTCondor configuration, read directly from the configuration files.
+
+    config = load_config()
+    config.get('GROUP_NAMES', subsystem='NEGOTIATOR')
+
+Files are read in the order HTCondor reads them: the global configuration
+file ($CONDOR_CONFIG, /etc/condor/condor_config, ...), the files of each
+LOCAL_CONFIG_DIR in lexicographical order, then each LOCAL_CONFIG_FILE.
+"include", "include ifexist", "if"/"elif"/"else"/"endif" with "defined"
+and boolean conditions, "NAME @=TAG" multi-line values and backslash line
+continuations are understood. Values are stored unexpanded, except for
+references of a macro to its own previous value, and $(NAME),
+$(NAME:default) and $ENV(NAME) are expanded on lookup, preferring
+SUBSYSTEM.NAME to NAME. Metaknobs (@use), include command and macro
+functions like $INT() raise ConfigError, so that callers can fall back to
+condor_config_val.
+
+load_config() keeps the parsed configuration until one of the files or
+directories read changes its mtime (checked at most once a second), so
+lookups after the first are dictionary reads.
+"""
+from __future__ import division
+from __future__ import print_function
+import argparse
+import os
+import re
+import sys
+from time import time
+
+DefaultLocations = ['/etc/condor/condor_config', '/usr/local/etc/condor_config',
+                    os.path.expanduser('~condor/condor_config')]
+
+_exclude_default = r'^((\..*)|(.*~)|(#.*)|(.*\.rpmsave)|(.*\.rpmnew))$'
+_name = re.compile(r'^[A-Za-z0-9_.]+$')
+_include = re.compile(r'^include\s*(.*?)\s*:\s*(.*)$', re.I)
+_conditional = re.compile(r'^(if|elif|else|endif)\b\s*(.*)$', re.I)
+_macro = re.compile(r'(?<!\$)\$(ENV)?\(([A-Za-z0-9_.]+)(?::([^()]*))?\)')
+_function = re.compile(r'(?<!\$)\$[A-Za-z]+\(')
+
+class ConfigError(Exception):
+    """Configuration this module cannot interpret"""
+
+class Config(object):
+    """Macro definitions of a configuration, by upper case name"""
+    def __init__(self, builtins=None):
+        self.table = {}
+        self.builtins = builtins or {}
+        # paths and directories read, with their mtimes
+        self.sources = {}
+        # when load_config() last found sources unchanged
+        self.checked = 0
+        self._expanded = {}
+
+    def define(self, name, value):
+        name = name.upper()
+        if '$(' in value and name in value.upper():
+            # references to the macro itself are to its previous value
+            previous = self.table.get(name)
+            def own(m):
+                if m.group(1) or m.group(2).upper() != name:
+                    return m.group(0)
+                return previous if previous is not None else (m.group(3) or '')
+            value = _macro.sub(own, value)
+        self.table[name] = value
+        self._expanded.clear()
+
+    def raw(self, name, subsystem=None):
+        """Unexpanded value of name (SUBSYSTEM.name if defined), or None"""
+        name = name.upper()
+        if subsystem:
+            value = self.table.get('%s.%s' % (subsystem.upper(), name))
+            if value is not None:
+                return value
+        value = self.table.get(name)
+        if value is None and name in self.builtins:
+            value = self.table[name] = self.builtins[name]()
+        return value
+
+    def get(self, name, default=None, subsystem=None):
+        """Expanded value of name, or default if it is not defined"""
+        key = (name.upper(), subsystem)
+        try:
+            return self._expanded[key]
+        except KeyError:
+            pass
+        value = self.raw(name, subsystem)
+        if value is None:
+            return default
+        value = self._expanded[key] = self.expand(value, subsystem)
+        return value
+
+    def get_list(self, name, subsystem=None):
+        """Expanded value of name split at commas and whitespace"""
+        return _list(self.get(name, subsystem=subsystem))
+
+    def expand(self, value, subsystem=None, depth=0):
+        if depth > 32:
+            raise ConfigError('macro nesting too deep in %r' % value)
+        def substitute(m):
+            env, name, default = m.groups()
+            if env:
+                return os.environ.get(name, default or '')
+            found = self.raw(name, subsystem)
+            if found is None:
+                return default or ''
+            return self.expand(found, subsystem, depth + 1)
+        # inner references first, so $(A$(B)) works
+        while True:
+            expanded = _macro.sub(substitute, value)
+            if expanded == value:
+                break
+            value = expanded
+        if _function.search(value):
+            raise ConfigError('unsupported macro function in %r' % value)
+        return value
+
+    def __contains__(self, name):
+        return self.raw(name) is not None
+
+    def is_true(self, text):
+        text = text.strip().lower()
+        if text in ('true', 'yes', 't', 'y'):
+            return True
+        if text in ('false', 'no', 'f', 'n', ''):
+            return False
+        try:
+            return float(text) != 0
+        except ValueError:
+            raise ConfigError('unsupported condition %r' % text)
+
+    def _condition(self, text):
+        text = self.expand(text.strip())
+        if text.startswith('!'):
+            return not self._condition(text[1:])
+        words = text.split()
+        if len(words) == 2 and words[0].lower() == 'defined':
+            return words[1] in self
+        return self.is_true(text)
+
+    def _stat(self, path):
+        self.sources[path] = os.stat(path).st_mtime
+
+    def read_file(self, path, depth=0):
+        """Process the configuration file at path"""
+        if depth > 20:
+            raise ConfigError('includes nested too deeply at %s' % path)
+        self._stat(path)
+        with open(path) as f:
+            lines = f.read().split('\n')
+        # if/elif/else state: (any branch taken yet, current branch active)
+        blocks = []
+        active = True
+        i = 0
+        while i < len(lines):
+            line = lines[i].strip()
+            i += 1
+            while line.endswith('\\') and i < len(lines):
+                line = line[:-1] + lines[i].strip()
+                i += 1
+            if not line or line[0] == '#':
+                continue
+            m = line[0] in 'iIeE' and _conditional.match(line)
+            if m:
+                keyword, condition = m.group(1).lower(), m.group(2)
+                if keyword == 'if':
+                    taken = active and self._condition(condition)
+                    blocks.append((taken, active))
+                    active = taken
+                elif not blocks:
+                    raise ConfigError('%s without if in %s' % (keyword, path))
+                elif keyword == 'endif':
+                    active = blocks.pop()[1]
+                else:
+                    taken, outer = blocks[-1]
+                    active = (outer and not taken
+                                and (keyword == 'else' or self._condition(condition)))
+                    blocks[-1] = (taken or active, outer)
+                continue
+            name, sep, value = line.partition('=')
+            name = name.strip()
+            if sep and name.endswith('@'):
+                # NAME @=TAG ... @TAG
+                tag = '@' + value.strip()
+                body = []
+                while i < len(lines) and lines[i].strip() != tag:
+                    body.append(lines[i])
+                    i += 1
+                i += 1
+                if active:
+                    self.define(name[:-1].strip(), '\n'.join(body))
+                continue
+            if sep and _name.match(name):
+                if active:
+                    self.define(name, value.strip())
+                continue
+            m = _include.match(line)
+            if m:
+                if active:
+                    self._include(m.group(1).lower().split(), m.group(2), path, depth)
+                continue
+            if line.startswith('@use') or line.lower().startswith('use '):
+                raise ConfigError('metaknobs are not supported: %s' % line)
+            raise ConfigError('cannot parse %s: %r' % (path, line))
+        if blocks:
+            raise ConfigError('if without endif in %s' % path)
+
+    def _include(self, options, target, parent, depth):
+        if 'command' in options:
+            raise ConfigError('include command is not supported')
+        target = self.expand(target.strip())
+        if not os.path.isabs(target):
+            target = os.path.join(os.path.dirname(parent), target)
+        if 'ifexist' in options and not os.path.exists(target):
+            return
+        self.read_file(target, depth + 1)
+
+    def read_dir(self, path):
+        """Process the files of directory path in lexicographical order"""
+        self._stat(path)
+        exclude = re.compile(self.get('LOCAL_CONFIG_DIR_EXCLUDE_REGEXP') or _exclude_default)
+        for name in sorted(os.listdir(path)):
+            filename = os.path.join(path, name)
+            if not exclude.match(name) and os.path.isfile(filename):
+                self.read_file(filename)
+
+def _list(value):
+    return [v for v in re.split(r'[\s,]+', value or '') if v]
+
+def find_config():
+    """Path of the global configuration file, located like HTCondor does"""
+    path = os.environ.get('CONDOR_CONFIG')
+    if path:
+        if path.upper() == 'ONLY_ENV':
+            raise ConfigError('CONDOR_CONFIG=ONLY_ENV is not supported')
+        return path
+    for path in DefaultLocations:
+        if os.path.exists(path):
+            return path
+    raise ConfigError('no HTCondor configuration file found')
+
+def _builtins():
+    def full_hostname():
+        import socket
+        return socket.getfqdn()
+    return {
+        'FULL_HOSTNAME': full_hostname,
+        'HOSTNAME': lambda: full_hostname().split('.')[0],
+        'TILDE': lambda: os.path.expanduser('~condor'),
+        'LOCAL_CONFIG_DIR_EXCLUDE_REGEXP': lambda: _exclude_default,
+    }
+
+def read_config(path=None):
+    """Parse the configuration rooted at global configuration file path"""
+    path = path or find_config()
+    config = Config(_builtins())
+    config.define('CONFIG_ROOT', os.path.dirname(os.path.abspath(path)))
+    config.read_file(path)
+    for directory in config.get_list('LOCAL_CONFIG_DIR'):
+        if os.path.isdir(directory):
+            config.read_dir(directory)
+    required = config.is_true(config.get('REQUIRE_LOCAL_CONFIG_FILE', 'true'))
+    for filename in config.get_list('LOCAL_CONFIG_FILE'):
+        if filename.endswith('|'):
+            raise ConfigError('LOCAL_CONFIG_FILE commands are not supported')
+        if os.path.exists(filename) or required:
+            config.read_file(filename)
+    return config
+
+_cache = {}
+
+def load_config(path=None, recheck=1.0):
+    """read_config(), reusing the result of the previous call as long as
+    the files and directories it read have the same mtimes; mtimes are
+    checked at most every recheck seconds"""
+    path = path or find_config()
+    config = _cache.get(path)
+    now = time()
+    if config is not None:
+        if now - config.checked < recheck:
+            return config
+        try:
+            if all(os.stat(p).st_mtime == mtime for p, mtime in config.sources.items()):
+                config.checked = now
+                return config
+        except OSError:
+            pass
+    config = _cache[path] = read_config(path)
+    config.checked = now
+    return config
+
+def read_expected(path):
+    """NAME = value pairs of a fixture file (as in augeas/test.txt)"""
+    expected = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                name, _, value = line.partition('=')
+                expected.append((name.strip(), value.strip()))
+    return expected
+
+def verify(path, expected_path, subsystem=None):
+    """Compare values of the configuration at path with a fixture file;
+    return the list of (name, expected, actual) mismatches. A value of
+    <undefined> in the fixture expects name not to be defined."""
+    config = read_config(path)
+    mismatches = []
+    for name, want in read_expected(expected_path):
+        got = config.get(name, '<undefined>', subsystem)
+        if got != want:
+            mismatches.append((name, want, got))
+    return mismatches
+
+def self_test(files=40, macros=100):
+    """Parse a generated configuration tree, check some expansions and
+    measure parsing and cached lookup time"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp(prefix='condorconfig.')
+    try:
+        confdir = os.path.join(tmpdir, 'config.d')
+        os.mkdir(confdir)
+        main = os.path.join(tmpdir, 'condor_config')
+        with open(main, 'w') as f:
+            f.write('RELEASE_DIR = /usr\nLOCAL_DIR = %s\n' % tmpdir)
+            f.write('LOCAL_CONFIG_DIR = $(LOCAL_DIR)/config.d\n')
+            f.write('GROUP_NAMES =\n')
+        for n in range(files):
+            with open(os.path.join(confdir, '%02d-generated' % n), 'w') as f:
+                f.write('# generated file %d\n' % n)
+                f.write('GROUP_NAMES = $(GROUP_NAMES) group%d\n' % n)
+                f.write('GROUP_QUOTA_group%d = %d\n' % (n, n * 10))
+                for m in range(macros):
+                    f.write('MACRO_%d_%d = $(RELEASE_DIR)/lib/%d \\\n    --flag %d\n'
+                                % (n, m, m, n))
+        t0 = time()
+        config = load_config(main)
+        parse = time() - t0
+        lines = files * (macros * 2 + 3) + 4
+        print('parse: %.2fms for %d files, %d lines' % (parse * 1000, files + 1, lines))
+        assert config.get('GROUP_NAMES').split() == ['group%d' % n for n in range(files)]
+        assert config.get('MACRO_3_7') == '/usr/lib/7 --flag 3', config.get('MACRO_3_7')
+        t0 = time()
+        for i in range(1000):
+            load_config(main).get('GROUP_QUOTA_group7')
+        print('cached lookup: %.2fus' % ((time() - t0) * 1000))
+        t0 = time()
+        for i in range(1000):
+            load_config(main, recheck=0).get('GROUP_QUOTA_group7')
+        print('cached lookup checking %d mtimes: %.1fus'
+                % (len(config.sources), (time() - t0) * 1000))
+        assert load_config(main).get('GROUP_QUOTA_group7') == '70'
+        with open(os.path.join(confdir, '99-late'), 'w') as f:
+            f.write('GROUP_QUOTA_group7 = 77\n')
+        assert load_config(main, recheck=0).get('GROUP_QUOTA_group7') == '77'
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Print HTCondor configuration values, like "
+                        "condor_config_val but without running it.",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('names', metavar='NAME', nargs='*', help='macros to print')
+    parser.add_argument('--config', metavar='PATH',
+        help='global configuration file (default: as HTCondor finds it)')
+    parser.add_argument('--subsystem', metavar='NAME',
+        help='prefer SUBSYSTEM.NAME definitions, e.g. NEGOTIATOR')
+    parser.add_argument('--verify', metavar='PATH',
+        help='compare values with the NAME = value lines of PATH; exit 1 '
+            'on mismatch')
+    parser.add_argument('--self-test', default=False, action='store_true',
+        help='check and benchmark a generated configuration tree instead')
+    args = parser.parse_args()
+    if args.self_test:
+        return self_test()
+    if args.verify:
+        mismatches = verify(args.config or find_config(), args.verify, args.subsystem)
+        for name, want, got in mismatches:
+            print('%s: expected %r, got %r' % (name, want, got))
+        return int(bool(mismatches))
+    config = load_config(args.config)
+    status = 0
+    for name in args.names:
+        value = config.get(name, subsystem=args.subsystem)
+        if value is None:
+            print('Not defined: %s' % name, file=sys.stderr)
+            status = 1
+        else:
+            print(value)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
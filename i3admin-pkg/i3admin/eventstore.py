@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+"""Append-only, segment-rotated store of job events with per-job lookup.
+
+    store = EventStore('/var/lib/condor_watch/events')
+    store.append(time(), 'Started', '1234.5', 'vbrik', 'IceCube', 'node17',
+                    source='submit-1')
+    store.close()
+    for event in timeline('/var/lib/condor_watch/events', cluster=1234,
+                            source='submit-1'):
+        print(event.time, event.event, event.jid)
+
+A store is a directory of segments NNNNNNNN.log, each holding one event per
+line, tab-separated:
+
+    CLUSTER.PROC  TIME  EVENT  OWNER  GROUP  HOST  SOURCE  MESSAGE
+
+SOURCE is the journal (schedd) the event came from, so that clusters of
+several schedds followed by one condor_watch are told apart, or "." if it
+was not given; lines written before sources were stored lack the field.
+
+A segment is sealed when it grows past segment_size: its NNNNNNNN.idx is
+written and it is never changed again. The index holds the time range of
+the segment and three sorted arrays of (key, offset) pairs, keyed by
+ClusterId and by crc32 of Owner and of SOURCE, so lookups are binary
+searches over the mmap'ed index followed by reads of the matching lines
+from the mmap'ed segment. The segment being written has no index; readers
+search it with mmap.find().
+
+append() only queues the event; a background thread writes the queue out
+and fsyncs the segment every sync_interval seconds.
+"""
+from __future__ import division
+from __future__ import print_function
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from bisect import bisect_left
+from collections import deque, namedtuple
+
+Event = namedtuple('Event', 'time event jid owner group host msg source')
+
+_header = struct.Struct('!4sIdd')    # magic, entries, first and last time
+_entry = struct.Struct('!II')        # key, offset
+_magic = b'JEV2'
+# index of segments sealed before sources were stored: no source array
+_magic_v1 = b'JEV1'
+
+if str is bytes:
+    _bytes = lambda s: s
+    _text = lambda s: s
+else:
+    _bytes = lambda s: s.encode('utf-8')
+    _text = lambda s: s.decode('utf-8', 'replace')
+
+def owner_key(owner):
+    return zlib.crc32(_bytes(owner)) & 0xffffffff
+
+source_key = owner_key
+
+def segments(path):
+    """Sorted segment numbers in the store at path"""
+    numbers = []
+    for name in os.listdir(path):
+        base, ext = os.path.splitext(name)
+        if ext == '.log' and base.isdigit():
+            numbers.append(int(base))
+    return sorted(numbers)
+
+def _segment_path(path, number, ext):
+    return os.path.join(path, '%08d%s' % (number, ext))
+
+def _parse(line):
+    fields = _text(line).split('\t', 7)
+    if len(fields) == 7:
+        # written before sources were stored; no field holds a tab
+        fields.insert(6, '.')
+    jid, t, event, owner, group, host, source, msg = fields
+    return Event(int(t), event, jid, owner, group, host, msg, source)
+
+class EventStore(object):
+    """Writer of the event store in directory path, created if necessary.
+    Only one process may write a store at a time."""
+    def __init__(self, path, segment_size=16 << 20, sync_interval=1.0):
+        import threading
+        from array import array
+        assert segment_size < 1 << 32
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.pending = deque()
+        self._array = array
+        numbers = segments(path)
+        if numbers and not os.path.exists(_segment_path(path, numbers[-1], '.idx')):
+            self._open(numbers[-1])
+        else:
+            self._open(numbers[-1] + 1 if numbers else 0)
+        self._lock = threading.Lock()
+        self._closed = False
+        thread = threading.Thread(target=self._run, name='eventstore')
+        thread.daemon = True
+        thread.start()
+
+    def _open(self, number):
+        """Start appending to segment number, recovering the in-memory index
+        of whatever it already holds (after a restart or crash)"""
+        self.number = number
+        self.clusters = self._array('I')
+        self.owners = self._array('I')
+        self.sources = self._array('I')
+        self.offsets = self._array('I')
+        self.times = [None, None]
+        filename = _segment_path(self.path, number, '.log')
+        offset = 0
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    event = _parse(line[:-1])
+                    self._index(event.jid, event.owner, event.source, event.time, offset)
+                    offset += len(line)
+        self.fobj = open(filename, 'ab')
+        # drop a partial line left by a crash
+        self.fobj.truncate(offset)
+        self.size = offset
+
+    def _index(self, jid, owner, source, t, offset):
+        self.clusters.append(int(jid[:jid.index('.')]))
+        self.owners.append(owner_key(owner))
+        self.sources.append(source_key(source))
+        self.offsets.append(offset)
+        if self.times[0] is None:
+            self.times[0] = t
+        self.times[1] = t
+
+    def append(self, t, event, jid, owner, group, host, msg='', source=None):
+        """Queue an event for writing; cheap enough for the caller's hot path"""
+        self.pending.append((t, event, jid, owner, group, host, msg, source))
+
+    def _run(self):
+        # not Event.wait(), which polls in python 2 and competes with the
+        # caller for the GIL
+        while not self._closed:
+            time.sleep(self.sync_interval)
+            with self._lock:
+                if not self._closed:
+                    self.flush()
+
+    def flush(self):
+        """Write out queued events and fsync; called by the background thread"""
+        from i3admin.term import nocolor
+        if not self.pending:
+            return
+        chunks = []
+        popleft = self.pending.popleft
+        while self.pending:
+            t, event, jid, owner, group, host, msg, source = popleft()
+            t = int(t)
+            owner = owner or '?'
+            source = source or '.'
+            if msg:
+                msg = str(msg)
+                if '\033' in msg:
+                    msg = nocolor(msg)
+                msg = msg.replace('\t', ' ').replace('\n', ' ').strip()
+            line = _bytes('%s\t%d\t%s\t%s\t%s\t%s\t%s\t%s\n' % (jid, t, event, owner,
+                                    group or '.', host or '?', source, msg))
+            self._index(jid, owner, source, t, self.size)
+            chunks.append(line)
+            self.size += len(line)
+            if self.size >= self.segment_size:
+                self._write(chunks)
+                chunks = []
+                self._seal()
+        self._write(chunks)
+
+    def _write(self, chunks):
+        if chunks:
+            self.fobj.write(b''.join(chunks))
+        self.fobj.flush()
+        os.fsync(self.fobj.fileno())
+
+    def _seal(self):
+        """Write the index of the current segment and start the next one"""
+        self.fobj.close()
+        count = len(self.offsets)
+        idx = _segment_path(self.path, self.number, '.idx')
+        with open(idx + '.tmp', 'wb') as f:
+            f.write(_header.pack(_magic, count, self.times[0] or 0, self.times[1] or 0))
+            for keys in (self.clusters, self.owners, self.sources):
+                order = sorted(range(count), key=keys.__getitem__)
+                f.write(b''.join(_entry.pack(keys[i], self.offsets[i]) for i in order))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(idx + '.tmp', idx)
+        self._open(self.number + 1)
+
+    def close(self):
+        """Write out queued events and stop the background thread. The
+        current segment is left unsealed and appended to on next open."""
+        with self._lock:
+            self._closed = True
+            self.flush()
+            self.fobj.close()
+
+class _Keys(object):
+    """Keys of the sorted (key, offset) entries of an index, as a sequence
+    that bisect can search without unpacking the whole index"""
+    def __init__(self, buf, start, count):
+        self.buf = buf
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return _entry.unpack_from(self.buf, self.start + i * _entry.size)[0]
+
+    def offsets(self, key):
+        """Offsets of the entries with key, in file order"""
+        i = bisect_left(self, key)
+        found = []
+        while i < self.count:
+            k, offset = _entry.unpack_from(self.buf, self.start + i * _entry.size)
+            if k != key:
+                break
+            found.append(offset)
+            i += 1
+        return sorted(found)
+
+def _mmap(filename):
+    import mmap
+    with open(filename, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _lines_at(data, offsets):
+    for offset in offsets:
+        end = data.find(b'\n', offset)
+        if end < 0:
+            break
+        yield data[offset:end]
+
+def _find_lines(data, needle):
+    """Complete lines of data containing needle; a leading newline of
+    needle also matches at the start of data"""
+    if needle.startswith(b'\n') and data[:len(needle) - 1] == needle[1:]:
+        end = data.find(b'\n')
+        if end < 0:
+            return
+        yield data[:end]
+    pos = data.find(needle)
+    while pos != -1:
+        last = pos + len(needle) - 1
+        start = data.rfind(b'\n', 0, last) + 1
+        end = data.find(b'\n', last)
+        if end < 0:
+            break
+        yield data[start:end]
+        pos = data.find(needle, end)
+
+def _all_lines(data):
+    start = 0
+    end = data.find(b'\n')
+    while end != -1:
+        yield data[start:end]
+        start = end + 1
+        end = data.find(b'\n', start)
+
+def _segment_events(path, number, cluster, owner, source, since):
+    data = _mmap(_segment_path(path, number, '.log'))
+    if data is None:
+        return
+    try:
+        idx = _segment_path(path, number, '.idx')
+        index = (_mmap(idx) if os.path.exists(idx) else None)
+        if index is not None:
+            magic, count, first, last = _header.unpack_from(index, 0)
+            if magic not in (_magic, _magic_v1):
+                raise ValueError('%s is not an event index' % idx)
+            if since is not None and last < since:
+                return
+            if cluster is not None:
+                keys = _Keys(index, _header.size, count)
+                lines = _lines_at(data, keys.offsets(cluster))
+            elif owner is not None:
+                keys = _Keys(index, _header.size + count * _entry.size, count)
+                lines = _lines_at(data, keys.offsets(owner_key(owner)))
+            elif magic == _magic:
+                keys = _Keys(index, _header.size + 2 * count * _entry.size, count)
+                lines = _lines_at(data, keys.offsets(source_key(source)))
+            else:
+                lines = _all_lines(data)
+        elif cluster is not None:
+            lines = _find_lines(data, _bytes('\n%d.' % cluster))
+        elif owner is not None:
+            lines = _find_lines(data, _bytes('\t%s\t' % owner))
+        else:
+            lines = _find_lines(data, _bytes('\t%s\t' % source))
+        for line in lines:
+            yield _parse(line)
+    finally:
+        data.close()
+
+def timeline(path, cluster=None, proc=None, owner=None, since=None, source=None):
+    """Events of a cluster (or just its job proc), of an owner or of a
+    source, oldest first, found in the event store at path; with a cluster
+    or owner, source restricts them to that journal"""
+    if cluster is not None and owner is not None:
+        raise ValueError('need either cluster or owner')
+    if cluster is None and owner is None and source is None:
+        raise ValueError('need a cluster, owner or source')
+    jid = ('%s.%s' % (cluster, proc) if proc is not None else None)
+    for number in segments(path):
+        for event in _segment_events(path, number, cluster, owner, source, since):
+            if cluster is not None and int(event.jid.split('.')[0]) != cluster:
+                continue
+            if jid is not None and event.jid != jid:
+                continue
+            if owner is not None and event.owner != owner:
+                continue
+            if source is not None and event.source != source:
+                continue
+            if since is not None and event.time < since:
+                continue
+            yield event
+
+def lookup(path, spec, since=None, source=None):
+    """timeline() of spec, which is CLUSTER, CLUSTER.PROC or an owner,
+    restricted to source if given"""
+    cluster, _, proc = spec.partition('.')
+    if cluster.isdigit() and (not proc or proc.isdigit()):
+        return timeline(path, cluster=int(cluster), proc=(int(proc) if proc else None),
+                            since=since, source=source)
+    return timeline(path, owner=spec, since=since, source=source)
+
+def format_event(event):
+    from time import localtime, strftime
+    line = '%s  %s%-13s %-14s  %-13s %-10s %-10s  %s' % (
+            strftime('%Y-%m-%d %T', localtime(event.time)),
+            ('%-14s ' % event.source if event.source != '.' else ''), event.event,
+            event.jid, event.owner, event.group, event.host, event.msg)
+    return line.rstrip()
+
+def self_test(events=10**6, clusters=10**5, owners=200, segment_size=4 << 20):
+    """Write events spread over several segments, check lookups against the
+    events written and measure append cost and lookup latency"""
+    import random
+    import shutil
+    import tempfile
+    rng = random.Random(0)
+    tmpdir = tempfile.mkdtemp(prefix='eventstore.')
+    try:
+        store = EventStore(tmpdir, segment_size=segment_size, sync_interval=0.2)
+        names = ['Started', 'Completed', 'Held', 'Interrupted', 'Submitted']
+        written = []
+        for i in range(events):
+            c = rng.randrange(clusters)
+            written.append((1.6e9 + i, names[i % 5], '%d.%d' % (c, i % 3),
+                        'user%d' % (c % owners), 'group%d' % (c % 7), 'node%d' % (i % 97),
+                        'msg\twith tab' if i % 1000 == 0 else '',
+                        # the same clusters from two schedds, and unnamed ones
+                        'schedd%d' % (i % 3) if i % 3 else None))
+        t0 = time.time()
+        for ev in written:
+            store.append(*ev)
+        append = (time.time() - t0) / events
+        store.close()
+        print('append cost per event: %.2fus, all written out at %.0f events/s (%d segments)'
+                % (append * 1e6, events / (time.time() - t0), len(segments(tmpdir))))
+        # reopening continues the unsealed segment
+        store = EventStore(tmpdir, segment_size=segment_size)
+        store.append(1.6e9 + events, 'Removed', '42.0', 'user42', 'group0', '?')
+        written.append((1.6e9 + events, 'Removed', '42.0', 'user42', 'group0', '?', '', None))
+        store.close()
+        # a line written before sources were stored
+        with open(_segment_path(tmpdir, segments(tmpdir)[-1], '.log'), 'ab') as f:
+            f.write(b'42.1\t%d\tHeld\tuser42\tgroup0\t?\told line\n' % (1.6e9 + events + 1))
+        written.append((1.6e9 + events + 1, 'Held', '42.1', 'user42', 'group0', '?',
+                        'old line', None))
+
+        for cluster in (42, 4242, 99999):
+            want = [(int(e[0]), e[1], e[2]) for e in written if e[2].split('.')[0] == str(cluster)]
+            t0 = time.time()
+            got = [(e.time, e.event, e.jid) for e in timeline(tmpdir, cluster=cluster)]
+            took = time.time() - t0
+            assert got == want, (cluster, got[:3], want[:3])
+            print('cluster %s: %d events in %.2fms' % (cluster, len(got), took * 1000))
+        got = list(lookup(tmpdir, '42.0'))
+        assert [e.jid for e in got] == ['42.0'] * len(got) and got[-1].event == 'Removed'
+        got = list(lookup(tmpdir, '42'))
+        assert got[-1].msg == 'old line' and got[-1].source == '.', got[-1]
+        for source in ('schedd1', 'schedd2'):
+            want = [(e[2], int(e[0])) for e in written
+                        if e[2].split('.')[0] == '42' and e[7] == source]
+            got = [(e.jid, e.time) for e in lookup(tmpdir, '42', source=source)]
+            assert got == want and want, (source, got[:3], want[:3])
+            want = sum(1 for e in written if e[7] == source)
+            t0 = time.time()
+            got = sum(1 for e in timeline(tmpdir, source=source))
+            took = time.time() - t0
+            assert got == want, (source, got, want)
+            print('source %s: %d events in %.2fms' % (source, got, took * 1000))
+        want = sum(1 for e in written if e[3] == 'user42')
+        t0 = time.time()
+        got = list(lookup(tmpdir, 'user42'))
+        took = time.time() - t0
+        assert len(got) == want, (len(got), want)
+        print('owner user42: %d events in %.2fms' % (len(got), took * 1000))
+        assert all(e.msg == 'msg with tab' for e in lookup(tmpdir, '0') if e.time % 1000 == 0)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Print the timeline of jobs, clusters or users from "
+                        "an event store written by condor_watch --events.",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('path', metavar='DIR', nargs='?', help='event store directory')
+    parser.add_argument('ids', metavar='ID', nargs='*',
+        help='CLUSTER, CLUSTER.PROC or user name')
+    parser.add_argument('--source', metavar='SCHEDD',
+        help='only events of the journal shown as SCHEDD')
+    parser.add_argument('--self-test', default=False, action='store_true',
+        help='check and benchmark a throwaway store instead')
+    args = parser.parse_args()
+    if args.self_test:
+        return self_test()
+    if not args.path:
+        parser.error('DIR is required')
+    for spec in args.ids:
+        for event in lookup(args.path, spec, source=args.source):
+            print(format_event(event))
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""Metrics exporter mode of condor_dashboard and condor_slots.
+
+    def collect(metrics):
+        metrics.add('group_jobs', 12, 'jobs by status', group='g', status='idle')
+    Exporter(collect, 'condor_dashboard', interval=60, textfile=PATH).run()
+
+Every interval seconds (on a fixed grid; missed cycles are skipped, not
+made up), collect() fills a Metrics object, which is then written in the
+Prometheus text format atomically to textfile (for node_exporter's
+textfile collector) and/or served on a local HTTP port. Every cycle also
+reports its own duration, the interval, the time it completed and the
+number of failed cycles, so that collection time approaching the interval
+can be alerted on. A failed cycle keeps the metrics of the last good one.
+"""
+from __future__ import division
+from __future__ import print_function
+import os
+import sys
+import time
+from collections import OrderedDict
+from i3admin.std import Scheduler, monotonic
+
+def add_exporter_arguments(parser, interval=None):
+    """Add the exporter argument group; with interval, also --interval
+    with that default (tools with --live already have one)"""
+    g = parser.add_argument_group('exporter arguments',
+            'Instead of printing once, collect metrics every --interval '
+            'seconds and export them in the Prometheus text format.')
+    g.add_argument('--textfile', metavar='PATH',
+            help='write metrics to PATH, atomically replacing it every cycle')
+    g.add_argument('--port', metavar='[HOST:]PORT',
+            help='serve metrics over HTTP on PORT of HOST (default: localhost)')
+    g.add_argument('--top', metavar='N', type=int, default=20,
+            help='export users individually only for the N biggest ones; '
+                 'add up the rest as user "other"')
+    if interval is not None:
+        g.add_argument('--interval', metavar='SEC', type=float, default=interval,
+                help='seconds between collection cycles')
+    return g
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _value(value):
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+class Metrics(object):
+    """Samples of one collection cycle, by metric name prefix_name"""
+    def __init__(self, prefix):
+        self.prefix = prefix
+        # name -> (help, type, [(labels, value)])
+        self.families = OrderedDict()
+
+    def add(self, name, value, help='', type='gauge', **labels):
+        """Add a sample; None values (undefined) are left out"""
+        name = '%s_%s' % (self.prefix, name)
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = (help, type, [])
+        if value is not None:
+            family[2].append((labels, value))
+
+    def text(self):
+        lines = []
+        for name, (help, type, samples) in self.families.items():
+            if help:
+                lines.append('# HELP %s %s' % (name, help.replace('\\', '\\\\')))
+            lines.append('# TYPE %s %s' % (name, type))
+            for labels, value in samples:
+                if labels:
+                    lines.append('%s{%s} %s' % (name, ','.join('%s="%s"' % (k, _escape(v))
+                                    for k, v in sorted(labels.items())), _value(value)))
+                else:
+                    lines.append('%s %s' % (name, _value(value)))
+        return '\n'.join(lines) + '\n'
+
+def top_keys(weights, n):
+    """Set of the n keys of dict weights with the largest weights"""
+    ranked = sorted(weights.items(), key=lambda kv: (-kv[1], kv[0]))
+    return set(k for k, w in ranked[:n])
+
+def write_textfile(path, text):
+    """Replace path with text atomically, so readers never see a partial file"""
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+def serve(address, exporter):
+    """Serve exporter.latest on address (host, port) from a daemon thread"""
+    import threading
+    try:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    except ImportError:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = exporter.latest.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    server = HTTPServer(address, Handler)
+    thread = threading.Thread(target=server.serve_forever, name='exporter')
+    thread.daemon = True
+    thread.start()
+    return server
+
+def parse_address(spec):
+    host, _, port = spec.rpartition(':')
+    return (host or 'localhost', int(port))
+
+class Exporter(object):
+    """Run collect(metrics) every interval seconds and export the results"""
+    def __init__(self, collect, prefix, interval, textfile=None, port=None):
+        self.collect = collect
+        self.prefix = prefix
+        self.interval = interval
+        self.textfile = textfile
+        self.port = port
+        self.errors = 0
+        # metrics of the last successful collect(), and all of them
+        self.collected = ''
+        self.latest = ''
+
+    def cycle(self):
+        t0 = monotonic()
+        metrics = Metrics(self.prefix)
+        try:
+            self.collect(metrics)
+            self.collected = metrics.text()
+        except Exception as e:
+            self.errors += 1
+            print('%s: collection failed: %s: %s' % (self.prefix, e.__class__.__name__, e),
+                    file=sys.stderr)
+        duration = monotonic() - t0
+        cycle = Metrics(self.prefix)
+        cycle.add('cycle_duration_seconds', duration,
+                'time the last collection cycle took')
+        cycle.add('cycle_interval_seconds', self.interval,
+                'configured time between collection cycles')
+        cycle.add('cycle_timestamp_seconds', time.time(),
+                'when the last collection cycle completed')
+        cycle.add('cycle_errors_total', self.errors,
+                'collection cycles that failed', type='counter')
+        self.latest = self.collected + cycle.text()
+        if self.textfile:
+            write_textfile(self.textfile, self.latest)
+        return duration
+
+    def run(self, count=float('inf')):
+        if self.port:
+            serve(parse_address(self.port), self)
+        # cycles missed while collecting are skipped instead of bursting
+        for duration in Scheduler().run(1 / self.interval, self.cycle, count):
+            if duration > 0.8 * self.interval:
+                print('%s: collection took %.1fs of the %.1fs interval'
+                        % (self.prefix, duration, self.interval), file=sys.stderr)
+
+def self_test():
+    """Check the text format, the textfile and the HTTP endpoint"""
+    import shutil
+    import tempfile
+    from contextlib import closing
+    try:
+        from urllib2 import urlopen
+    except ImportError:
+        from urllib.request import urlopen
+    metrics = Metrics('test')
+    metrics.add('jobs', 3, 'jobs by status', group='a"b', status='idle')
+    metrics.add('jobs', 4.5, group='c\\d\n', status='running')
+    metrics.add('quota', float('inf'), group='x')
+    metrics.add('rss', None, user='u')
+    text = metrics.text()
+    assert text == ('# HELP test_jobs jobs by status\n'
+                    '# TYPE test_jobs gauge\n'
+                    'test_jobs{group="a\\"b",status="idle"} 3\n'
+                    'test_jobs{group="c\\\\d\\n",status="running"} 4.5\n'
+                    '# TYPE test_quota gauge\n'
+                    'test_quota{group="x"} +Inf\n'
+                    '# TYPE test_rss gauge\n'), text
+    assert top_keys({'a': 1, 'b': 5, 'c': 3}, 2) == set(['b', 'c'])
+    tmpdir = tempfile.mkdtemp(prefix='exporter.')
+    try:
+        path = os.path.join(tmpdir, 'test.prom')
+        cycles = []
+        def collect(metrics):
+            cycles.append(1)
+            if len(cycles) == 2:
+                raise RuntimeError('schedd is gone')
+            metrics.add('cycles', len(cycles))
+        exporter = Exporter(collect, 'test', 0.05, textfile=path)
+        server = serve(('localhost', 0), exporter)
+        exporter.run(count=3)
+        with open(path) as f:
+            text = f.read()
+        assert 'test_cycles 3\n' in text and 'test_cycle_errors_total 1\n' in text, text
+        assert os.listdir(tmpdir) == ['test.prom']
+        url = 'http://localhost:%d/metrics' % server.server_address[1]
+        with closing(urlopen(url)) as response:
+            assert response.read().decode('utf-8') == text
+        server.shutdown()
+        print(text, end='')
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    self_test()
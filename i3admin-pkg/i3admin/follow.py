@@ -3,6 +3,7 @@
 from __future__ import division
 from __future__ import print_function
 import argparse
+import errno
 import os
 import sys
 import time
@@ -23,6 +24,173 @@ def _get_file(filename, sleep=1.0, retry=False):
                 raise
         return fobj,stat
 
+if str is bytes:
+    _text = lambda line: line
+else:
+    _text = lambda line: line.decode('utf-8', 'replace')
+
+class _Inotify(object):
+    """Bare-bones ctypes binding of Linux inotify, used only to sleep until
+    something changes in the watched directories. Events are drained, not
+    decoded: the caller re-checks all of its files on every wake-up."""
+    # IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x002 | 0x004 | 0x040 | 0x080 | 0x100 | 0x200
+
+    def __init__(self, dirs):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0o2000000))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        for d in set(dirs):
+            path = (d if isinstance(d, bytes) else d.encode(sys.getfilesystemencoding()))
+            if self._libc.inotify_add_watch(self.fd, path, self.MASK) < 0:
+                err = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(err, 'inotify_add_watch failed for %s' % d)
+
+    def wait(self, timeout):
+        """Block until a change or timeout; return True if woken by a change"""
+        import select
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except (select.error, OSError) as e:
+            # python 2 does not retry select() interrupted by a signal
+            if e.args[0] != errno.EINTR:
+                raise
+            return False
+        if ready:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+        return bool(ready)
+
+    def close(self):
+        os.close(self.fd)
+
+class _Poller(object):
+    """Fallback for _Inotify where it is not available"""
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return False
+
+    def close(self):
+        pass
+
+class _Tail(object):
+    """Non-blocking reader of one file followed by name (see follow_many)"""
+    def __init__(self, filename, from_tail):
+        self.filename = filename
+        self.fd = None
+        self.ino = None
+        self.linebuf = b''
+        self.eof = True
+        self._open(from_tail)
+
+    def _open(self, from_tail=False):
+        try:
+            fd = os.open(self.filename, os.O_RDONLY)
+        except OSError as e:
+            stderr('follow: problem with file "%s": %s' % (self.filename, e.args))
+            return False
+        self.fd = fd
+        fstat = os.fstat(fd)
+        self.ino = fstat.st_ino
+        if from_tail:
+            # start after the last newline; a partial last line stays in linebuf
+            start = max(0, fstat.st_size - 65536)
+            os.lseek(fd, start, os.SEEK_SET)
+            tail = os.read(fd, fstat.st_size - start)
+            self.linebuf = tail[tail.rfind(b'\n') + 1:]
+        return True
+
+    def _flush(self):
+        if not self.linebuf:
+            return []
+        stderr('follow: forced to flush; linebuf="%s"' % _text(self.linebuf))
+        line, self.linebuf = self.linebuf, b''
+        return [line]
+
+    def read(self, bufsize=65536):
+        """Return complete lines in the next bufsize bytes; self.eof tells
+        whether there may be more to read right away"""
+        if self.fd is None and not self._open():
+            return []
+        lines = []
+        data = os.read(self.fd, bufsize)
+        if data:
+            lines = (self.linebuf + data).split(b'\n')
+            self.linebuf = lines.pop()
+        self.eof = (len(data) < bufsize)
+        if not self.eof:
+            return lines
+        # at eof now; check if the name still refers to the same file
+        try:
+            fstat = os.stat(self.filename)
+        except OSError:
+            # deleted; keep the old file open until the name reappears
+            return lines + self._flush()
+        if fstat.st_ino != self.ino:
+            stderr('follow: file inode changed; re-opening %s' % self.filename)
+            lines.extend(self._flush())
+            os.close(self.fd)
+            self.fd = None
+            if self._open():
+                lines.extend(self.read())
+        elif fstat.st_size < os.lseek(self.fd, 0, os.SEEK_CUR):
+            stderr('follow: file shrunk; re-opening')
+            lines.extend(self._flush())
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            lines.extend(self.read())
+        return lines
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def follow_many(filenames, sleep=1.0, from_tail=True, heartbeat=False):
+    """Follow several files by name at once, like follow() with keep_trying.
+    Yields (index into filenames, time read, line) as one stream: lines of
+    each file come in file order, and the stream is ordered by time read.
+    Sleeps on inotify (polls every sleep seconds where that is unavailable)
+    so idle files cost nothing and new data is picked up without delay.
+    With heartbeat, also yields (None, time, None) whenever it wakes up with
+    nothing to read, at least every sleep seconds, for periodic work."""
+    # watch before the first read so no write can slip in between
+    dirs = [os.path.dirname(os.path.abspath(f)) for f in filenames]
+    try:
+        waiter = _Inotify(dirs)
+    except (OSError, AttributeError) as e:
+        stderr('follow: inotify unavailable (%s); polling every %ss' % (e, sleep))
+        waiter = _Poller()
+    tails = [_Tail(f, from_tail) for f in filenames]
+    try:
+        while True:
+            # one chunk per file per round, so a busy file does not starve
+            # the others and a backlog is not read into memory all at once
+            busy = False
+            for idx, tail in enumerate(tails):
+                lines = tail.read()
+                busy = busy or bool(lines) or not tail.eof
+                if lines:
+                    stamp = time.time()
+                    for line in lines:
+                        yield idx, stamp, _text(line).strip()
+            if not busy:
+                # also wake up periodically in case a change went unnoticed,
+                # e.g. if the watched directory itself was replaced
+                waiter.wait(sleep)
+                if heartbeat:
+                    yield None, time.time(), None
+    finally:
+        for tail in tails:
+            tail.close()
+        waiter.close()
 
 def follow(filename, sleep=1.0, from_tail=True, keep_trying=True):
     curfile,curfstat = _get_file(filename, keep_trying, sleep)
@@ -91,6 +259,58 @@ def follow(filename, sleep=1.0, from_tail=True, keep_trying=True):
                 yield linebuf
             return
 
+def self_test():
+    """Check follow_many on appends to several files, rotation and
+    truncation, with inotify and with polling"""
+    import shutil
+    import tempfile
+    global _Inotify
+    def drain(stream):
+        # everything written so far has been read once a round comes up empty
+        got = []
+        for idx, stamp, line in stream:
+            if idx is None:
+                return got
+            got.append((idx, line))
+    def write(name, data, mode='a'):
+        with open(name, mode) as f:
+            f.write(data)
+    inotify = _Inotify
+    tmpdir = tempfile.mkdtemp(prefix='follow.')
+    try:
+        for waiter in ('inotify', 'polling'):
+            if waiter == 'polling':
+                def _Inotify(dirs):
+                    raise OSError(errno.ENOSYS, 'disabled by self_test')
+            a, b, c = names = [os.path.join(tmpdir, '%s.%s' % (waiter, n)) for n in 'abc']
+            write(a, 'old\na0', 'w')
+            write(b, '', 'w')
+            write(c, 'c0\n', 'w')
+            stream = follow_many(names, sleep=0.05, heartbeat=True)
+            assert drain(stream) == []
+            # appends to several files; a partial line is completed
+            write(a, 'tail\na1\n')
+            write(b, 'b1\nb2\n')
+            write(c, 'c1 is a long line\n')
+            got = drain(stream)
+            assert sorted(got) == [(0, 'a0tail'), (0, 'a1'), (1, 'b1'), (1, 'b2'),
+                                    (2, 'c1 is a long line')], got
+            # rotation: the rest of the old file, its partial last line, then the new file
+            write(b, 'b3\nb-partial')
+            os.rename(b, b + '.1')
+            write(b, 'b4\n', 'w')
+            # truncation: re-read from the start
+            write(c, 'c2\n', 'w')
+            got = drain(stream)
+            assert got == [(1, 'b3'), (1, 'b-partial'), (1, 'b4'), (2, 'c2')], got
+            write(a, 'a2\n')
+            assert drain(stream) == [(0, 'a2')]
+            stream.close()
+            print('follow_many with %s: ok' % waiter)
+    finally:
+        _Inotify = inotify
+        shutil.rmtree(tmpdir)
+
 def main():
     parser = argparse.ArgumentParser(
             description="An implementation of tail -f as a Python module. "
@@ -102,18 +322,29 @@ def main():
                         "Some content may be discarded during abnormal events "
                         "such as file rotations. ",
             formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('file', metavar='PATH', nargs=1,
-        help='File to follow')
+    parser.add_argument('file', metavar='PATH', nargs='*',
+        help='File(s) to follow; several files are followed as one stream, '
+            'prefixed with file names like tail, and always --keep-trying')
     parser.add_argument('--sleep-time', metavar='SEC', type=float, default=1.0, 
         help="Sleep duration when waiting")
     parser.add_argument('--keep-trying', action='store_true', default=False,
         help="Keep retrying on EOF")
     parser.add_argument('--from-tail', action='store_true', default=False,
         help="Seek to the last newline or end of FILE before starting.")
+    parser.add_argument('--self-test', default=False, action='store_true',
+        help="check following of several files, rotation and truncation")
     args = parser.parse_args()
+    if args.self_test:
+        return self_test()
+    if not args.file:
+        parser.error('PATH is required')
 
-    for l in follow(args.file[0], args.sleep_time, args.from_tail, args.keep_trying):
-        print(l)
+    if len(args.file) > 1:
+        for idx, stamp, l in follow_many(args.file, args.sleep_time, args.from_tail):
+            print('%s: %s' % (args.file[idx], l))
+    else:
+        for l in follow(args.file[0], args.sleep_time, args.from_tail, args.keep_trying):
+            print(l)
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+"""Direct, indexed reading of the condor_schedd history file.
+
+    history = HistoryFile('/var/lib/condor/spool/history')
+    for ad in history.query({'cluster': [1234]}, attrs=['ProcId', 'Owner']):
+        print(ad)
+
+The history file holds one ad per completed job, as "Attr = value" lines
+followed by a banner line:
+
+    *** Offset = 0 ClusterId = 1234 ProcId = 5 Owner = "vbrik" CompletionDate = ...
+
+Ads are read from the end of the (mmap'ed) file backwards, so recent jobs
+come first. Lookups by ClusterId and Owner use a sidecar index built from
+the banner lines alone. The index is extended with the ads appended since
+the previous use, and rebuilt from scratch when the history file was
+rotated or truncated. It consists of sorted runs, each holding entries for
+a stretch of the history file as two arrays of (key, ad offset) pairs, one
+sorted by ClusterId and one by crc32 of Owner. A new run is merged into
+the previous one while that is not much larger, so there are only
+logarithmically many runs to bisect.
+"""
+from __future__ import division
+from __future__ import print_function
+import argparse
+import os
+import re
+import struct
+import sys
+import zlib
+from bisect import bisect_left
+
+# magic, device, inode, bytes indexed, crc32 of the first (up to) 4KB, runs
+_header = struct.Struct('=4sQQQII')
+_magic = b'CHX1'
+_dirty = b'CHX0'
+_max_runs = 64
+_run = struct.Struct('=QQ')          # offset in index file, entries
+_entry = struct.Struct('!IQ')        # key, ad offset in history file
+_runs_at = _header.size
+_data_at = _header.size + _max_runs * _run.size
+_head = 4096
+
+_banner = re.compile(br'ClusterId = (\d+) .*?Owner = "([^"]*)"')
+_escape = re.compile(r'\\(.)')
+
+if str is bytes:
+    _text = lambda s: s
+else:
+    _text = lambda s: s.decode('utf-8', 'replace')
+
+def owner_key(owner):
+    if not isinstance(owner, bytes):
+        owner = owner.encode('utf-8')
+    return zlib.crc32(owner) & 0xffffffff
+
+def default_index_path(history):
+    """Sidecar next to history if its directory is writable, otherwise a
+    file in the user's cache directory"""
+    history = os.path.abspath(history)
+    if os.access(os.path.dirname(history), os.W_OK):
+        return history + '.idx'
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache, 'i3admin', history.strip('/').replace('/', '%') + '.idx')
+
+def parse_value(text):
+    """Python value of a ClassAd literal; expressions are left as strings"""
+    if text[:1] == '"' and text[-1:] == '"':
+        text = text[1:-1]
+        return (_escape.sub(r'\1', text) if '\\' in text else text)
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    low = text.lower()
+    if low in ('true', 'false'):
+        return low == 'true'
+    if low == 'undefined':
+        return None
+    return text
+
+_attr_res = {}
+
+def parse_ad(text, attrs=None):
+    """Dict of an ad in "Attr = value" lines. With attrs, only those are
+    parsed, and named as spelled in attrs (attribute names are case
+    insensitive)"""
+    text = _text(text)
+    if attrs is None:
+        pairs = (line.partition(' = ')[::2] for line in text.split('\n') if ' = ' in line)
+        return dict((attr, parse_value(value.strip())) for attr, value in pairs)
+    key = tuple(attrs)
+    if key not in _attr_res:
+        names = '|'.join(re.escape(a) for a in sorted(set(attrs)))
+        _attr_res[key] = (re.compile(r'^(%s) = (.*)$' % names, re.M | re.I),
+                            dict((a.lower(), a) for a in attrs))
+    regex, spelling = _attr_res[key]
+    return dict((spelling[attr.lower()], parse_value(value.strip()))
+                    for attr, value in regex.findall(text))
+
+def _mmap(fobj):
+    import mmap
+    if not os.fstat(fobj.fileno()).st_size:
+        return b''
+    return mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+class _Keys(object):
+    """Keys of the sorted (key, offset) entries of a run, as a sequence that
+    bisect can search without unpacking the whole run"""
+    def __init__(self, buf, start, count):
+        self.buf = buf
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return _entry.unpack_from(self.buf, self.start + i * _entry.size)[0]
+
+    def offsets(self, key):
+        i = bisect_left(self, key)
+        found = []
+        while i < self.count:
+            k, offset = _entry.unpack_from(self.buf, self.start + i * _entry.size)
+            if k != key:
+                break
+            found.append(offset)
+            i += 1
+        return found
+
+    def entries(self):
+        flat = struct.unpack_from('!' + 'IQ' * self.count, self.buf, self.start)
+        return list(zip(flat[0::2], flat[1::2]))
+
+class HistoryIndex(object):
+    """Sidecar index of ad offsets by ClusterId and Owner of a history file"""
+    def __init__(self, history, path=None):
+        self.history = history
+        self.path = path or default_index_path(history)
+        # bytes of history read and runs left by the last update(), for
+        # testing and tuning
+        self.scanned = 0
+        self.runs = 0
+
+    def _valid(self, header, stat, data):
+        magic, dev, ino, covered, head_crc, runs = header
+        return (magic == _magic and (dev, ino) == (stat.st_dev, stat.st_ino)
+                    and covered <= len(data)
+                    and zlib.crc32(data[:min(covered, _head)]) & 0xffffffff == head_crc)
+
+    def update(self, data, stat):
+        """Bring the index up to date with data, the mmap'ed history file
+        with os.stat() result stat; return (index mmap, runs)"""
+        import fcntl
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+b') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.seek(0)
+            raw = f.read(_data_at)
+            header = (_header.unpack_from(raw) if len(raw) == _data_at else None)
+            if header and self._valid(header, stat, data):
+                covered = header[3]
+                table = [_run.unpack_from(raw, _runs_at + i * _run.size)
+                            for i in range(header[5])]
+            else:
+                covered, table = 0, []
+                f.truncate(0)
+            self.scanned = len(data) - covered
+            new, covered = self._scan(data, covered)
+            if new:
+                self._add_run(f, table, new, covered, stat, data)
+            index = _mmap(f)
+        self.runs = len(table)
+        return index, table
+
+    @staticmethod
+    def _scan(data, start):
+        """(cluster, owner key, offset) of the complete ads after offset
+        start, and the offset just past the last of them"""
+        entries = []
+        ad_start = start
+        pos = data.find(b'\n*** ', max(start - 1, 0))
+        while pos != -1:
+            end = data.find(b'\n', pos + 1)
+            if end < 0:
+                break
+            m = _banner.search(data, pos + 1, end)
+            if m:
+                entries.append((int(m.group(1)), owner_key(m.group(2)), ad_start))
+            ad_start = end + 1
+            pos = data.find(b'\n*** ', end)
+        return entries, ad_start
+
+    def _add_run(self, f, table, new, covered, stat, data):
+        """Merge new entries with the trailing runs that are not much
+        larger, write the result as the last run and update the header"""
+        f.seek(0)
+        f.write(_header.pack(_dirty, 0, 0, 0, 0, 0))
+        f.flush()
+        index = _mmap(f)
+        clusters = [(c, o) for c, k, o in new]
+        owners = [(k, o) for c, k, o in new]
+        while table and (table[-1][1] <= 2 * len(clusters) or len(table) >= _max_runs):
+            at, count = table.pop()
+            clusters += _Keys(index, at, count).entries()
+            owners += _Keys(index, at + count * _entry.size, count).entries()
+        at = (table[-1][0] + 2 * table[-1][1] * _entry.size if table else _data_at)
+        if index:
+            index.close()
+        clusters.sort()
+        owners.sort()
+        table.append((at, len(clusters)))
+        f.seek(at)
+        f.truncate(at)
+        for entries in (clusters, owners):
+            flat = [x for entry in entries for x in entry]
+            f.write(struct.pack('!' + 'IQ' * len(entries), *flat))
+        f.seek(_runs_at)
+        f.write(b''.join(_run.pack(*run) for run in table))
+        f.seek(0)
+        head_crc = zlib.crc32(data[:min(covered, _head)]) & 0xffffffff
+        f.write(_header.pack(_magic, stat.st_dev, stat.st_ino, covered, head_crc, len(table)))
+        f.flush()
+
+class HistoryFile(object):
+    """Reader of a condor_schedd history file"""
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index = HistoryIndex(path, index_path)
+
+    def _ads_backwards(self, data, end=None):
+        """(offset, text) of complete ads, last first"""
+        end = len(data) if end is None else end
+        # a banner line without its newline is still being written
+        last = data.rfind(b'\n', 0, end)
+        pos = data.rfind(b'\n*** ', 0, last)
+        while pos != -1:
+            prev = data.rfind(b'\n*** ', 0, pos)
+            start = (data.find(b'\n', prev + 1) + 1 if prev != -1 else 0)
+            yield start, data[start:pos + 1]
+            pos = prev
+
+    def _ads_at(self, data, offsets):
+        """(offset, text) of the ads at offsets, last first"""
+        for offset in sorted(set(offsets), reverse=True):
+            end = data.find(b'\n*** ', offset)
+            if end >= 0:
+                yield offset, data[offset:end + 1]
+
+    def _lookup(self, data, stat, cluster=None, owner=None):
+        index, table = self.index.update(data, stat)
+        offsets = []
+        try:
+            for at, count in table:
+                if cluster is not None:
+                    offsets += _Keys(index, at, count).offsets(cluster)
+                else:
+                    offsets += _Keys(index, at + count * _entry.size, count).offsets(owner_key(owner))
+        finally:
+            if index:
+                index.close()
+        return offsets
+
+    def query(self, where=None, constraint=None, attrs=None, limit=None):
+        """Ads (dicts) of jobs matching where (see i3admin.watchsock) and the
+        ClassAd constraint, most recently completed first. A single cluster
+        or owner in where is looked up in the index; anything else is a
+        backwards scan of the whole file."""
+        from i3admin.watchsock import Fields, split_values, where_filter
+        where = dict(where or {})
+        match = where_filter(where)
+        expr = None
+        if constraint and constraint.strip().lower() not in ('true', '(true)'):
+            import classad
+            expr = classad.ExprTree(str(constraint))
+        needed = (None if attrs is None or expr is not None
+                    else list(attrs) + [Fields[f] for f in where])
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            data = _mmap(f)
+            try:
+                inc = dict((field, split_values(where.get(field, ()))[0])
+                                for field in ('cluster', 'owner'))
+                ads = None
+                try:
+                    if len(inc['cluster']) == 1:
+                        ads = self._ads_at(data, self._lookup(data, stat, cluster=inc['cluster'][0]))
+                    elif len(inc['owner']) == 1:
+                        ads = self._ads_at(data, self._lookup(data, stat, owner=inc['owner'][0]))
+                except (IOError, OSError) as e:
+                    print('history: cannot use index %s: %s' % (self.index.path, e), file=sys.stderr)
+                if ads is None:
+                    ads = self._ads_backwards(data)
+                count = 0
+                for offset, text in ads:
+                    ad = parse_ad(text, needed)
+                    if not match(ad):
+                        continue
+                    if expr is not None and not self._matches(ad, expr):
+                        continue
+                    if attrs is not None:
+                        ad = dict((a, ad[a]) for a in attrs if a in ad)
+                    yield ad
+                    count += 1
+                    if limit and count >= limit:
+                        return
+            finally:
+                if data:
+                    data.close()
+
+    @staticmethod
+    def _matches(ad, expr):
+        import classad
+        ad = classad.ClassAd(dict(ad))
+        ad['HistoryConstraint'] = expr
+        return ad.eval('HistoryConstraint') is True
+
+def _synthetic_ad(cluster, proc, owner, t):
+    lines = ['ClusterId = %d' % cluster, 'ProcId = %d' % proc, 'Owner = "%s"' % owner,
+                'AccountingGroup = "group%d.%s"' % (cluster % 3, owner),
+                'JobStatus = 4', 'JobUniverse = 5', 'QDate = %d' % (t - 1800),
+                'JobCurrentStartDate = %d' % (t - 900), 'CompletionDate = %d' % t,
+                'EnteredCurrentStatus = %d' % t, 'NumJobStarts = 1',
+                'RequestMemory = 2000', 'RequestCpus = 1', 'RequestDisk = 1000000',
+                'ResidentSetSize_RAW = 1200000', 'ImageSize_RAW = 1300000',
+                'DiskUsage_RAW = 52000', 'RemoteSysCpu = 3.0',
+                'Cmd = "/home/%s/run \\"quoted\\""' % owner, 'RemoteUserCpu = 750.0',
+                'LastRemoteHost = "slot1@node%d.example.org"' % (cluster % 50),
+                'Requirements = (TARGET.Arch == "X86_64") && (TARGET.OpSys == "LINUX")']
+    lines += ['Filler%d = "%s"' % (i, 'x' * 40) for i in range(20)]
+    lines.append('*** Offset = 0 ClusterId = %d ProcId = %d Owner = "%s" CompletionDate = %d'
+                    % (cluster, proc, owner, t))
+    return ''.join(l + '\n' for l in lines)
+
+def self_test(ads=200000, clusters=20000, owners=50):
+    """Build the index of a synthetic history file, check lookups against a
+    backwards scan, then check that appended ads are indexed incrementally
+    and that rotation causes a rebuild"""
+    import random
+    import shutil
+    import tempfile
+    import time
+    from i3admin.watchsock import where_filter
+    rng = random.Random(0)
+    tmpdir = tempfile.mkdtemp(prefix='history.')
+    path = os.path.join(tmpdir, 'history')
+    def write(count, mode='a'):
+        with open(path, mode) as f:
+            for i in range(count):
+                c = rng.randrange(clusters)
+                f.write(_synthetic_ad(c, rng.randrange(10), 'user%d' % (c % owners),
+                                        1600000000 + i))
+    try:
+        write(ads, 'w')
+        history = HistoryFile(path)
+        print('history: %d ads, %.0fMB' % (ads, os.path.getsize(path) / 2**20))
+        t0 = time.time()
+        got = list(history.query({'cluster': [42]}, attrs=['ClusterId', 'ProcId', 'Cmd']))
+        print('index build + lookup: %.2fs (index %.1fMB)' % (time.time() - t0,
+                    os.path.getsize(history.index.path) / 2**20))
+        want = [ad for ad in history.query({'universe': [5]}, attrs=['ClusterId', 'ProcId', 'Cmd'])
+                    if ad['ClusterId'] == 42]
+        assert got == want and got, (len(got), len(want))
+        assert got[0]['Cmd'] == '/home/user42/run "quoted"', got[0]
+        attrs = ['ClusterId', 'ProcId', 'Owner', 'AccountingGroup']
+        everything = list(history.query(attrs=attrs))
+        assert len(everything) == ads
+        for where in ({'cluster': [4242]}, {'owner': ['user7'], 'group': ['group1']},
+                        {'cluster': [4242], 'owner': ['!user42']}):
+            t0 = time.time()
+            got = list(history.query(where, attrs=attrs))
+            took = time.time() - t0
+            assert history.index.scanned == 0
+            assert got == list(filter(where_filter(where), everything)), where
+            print('%s: %d ads in %.2fms' % (where, len(got), took * 1000))
+        runs = history.index.runs
+        write(1000)
+        t0 = time.time()
+        got = list(history.query({'cluster': [42]}, attrs=['CompletionDate']))
+        print('incremental update of %d bytes + lookup: %.2fms' % (history.index.scanned,
+                    (time.time() - t0) * 1000))
+        assert 0 < history.index.scanned < os.path.getsize(path) / 100
+        assert got[0]['CompletionDate'] >= got[-1]['CompletionDate']
+        print('index runs: %d -> %d' % (runs, history.index.runs))
+        os.rename(path, path + '.old')
+        write(100, 'w')
+        list(history.query({'cluster': [42]}))
+        assert history.index.scanned == os.path.getsize(path)
+        print('rotation: index rebuilt')
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Print ads of the condor_schedd history file, most "
+                        "recent first.",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('path', metavar='HISTORY', nargs='?', help='history file')
+    parser.add_argument('--cluster', type=int, help='only jobs of this cluster')
+    parser.add_argument('--owner', help='only jobs of this owner')
+    parser.add_argument('-c', dest='constraint', help='ClassAd constraint')
+    parser.add_argument('-n', dest='limit', type=int, help='print at most N ads')
+    parser.add_argument('--self-test', default=False, action='store_true',
+        help='check and benchmark the index on a synthetic history file instead')
+    args = parser.parse_args()
+    if args.self_test:
+        return self_test()
+    if not args.path:
+        parser.error('HISTORY is required')
+    where = {}
+    if args.cluster is not None:
+        where['cluster'] = [args.cluster]
+    if args.owner:
+        where['owner'] = [args.owner]
+    for ad in HistoryFile(args.path).query(where, args.constraint, limit=args.limit):
+        print('\n'.join('%s = %r' % kv for kv in sorted(ad.items())))
+        print()
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -2,12 +2,10 @@
 """Pretty Tables"""
 from __future__ import division
 from __future__ import print_function
-import argparse
 import re
 import string
 import sys
 from collections import OrderedDict
-from pprint import pprint
 
 ansi = {
     'nop':'', #noop
@@ -135,8 +133,6 @@ class CellBlock(object):
             rubric_line += ' ' * (offset - len(rubric_line))
             rubric_line += (self.sep if len(rubric_line) else '')
             rubric_line += string.center(rubric, width, '-')
-        if rubric_line:
-            print(ansi['*blk'] + rubric_line)
         titles = []
         for c in self.cells.values():
             if c.title:
@@ -144,6 +140,8 @@ class CellBlock(object):
                 titles.append(ansi[style] + ansi[c.style] + t + ansi['rst'])
             else:
                 titles.append(c.render())
+        if rubric_line:
+            return ansi['*blk'] + rubric_line + '\n' + self.sep.join(titles)
         return self.sep.join(titles)
 
     def legend(self):
@@ -156,6 +154,7 @@ class CellBlock(object):
                 print(fmt % (c.title, c.descr))
 
 def main():
+    import argparse
     parser = argparse.ArgumentParser(
             description="",
             formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""Constant-memory rolling statistics for event streams.
+
+    counts = WindowCounts(('started', 'completed'), window=3600)
+    counts.add(0, time())
+    runtime = WindowSketch(window=3600)
+    runtime.add(seconds, time())
+    runtime.quantile(0.95, time())
+
+Updates cost O(1) (amortized over elapsed buckets for WindowCounts);
+queries are proportional to the (bounded) number of buckets.
+"""
+from __future__ import division
+from __future__ import print_function
+import heapq
+import math
+import time
+
+class WindowCounts(object):
+    """Counts of several kinds of events over the last window seconds.
+    Events are counted in fixed-width time buckets, so counts expire with a
+    granularity of window/buckets. Empty buckets take no memory."""
+    __slots__ = ('kinds', 'width', 'ring', 'totals', 'head')
+
+    def __init__(self, kinds, window=3600, buckets=12):
+        self.kinds = tuple(kinds)
+        self.width = window / buckets
+        self.ring = [None] * buckets
+        self.totals = [0] * len(self.kinds)
+        self.head = None
+
+    def _roll(self, t):
+        b = int(t // self.width)
+        if self.head is None or b - self.head >= len(self.ring):
+            if self.head is not None:
+                self.ring = [None] * len(self.ring)
+                self.totals = [0] * len(self.kinds)
+            self.head = b
+        while self.head < b:
+            self.head += 1
+            slot = self.ring[self.head % len(self.ring)]
+            if slot is not None:
+                for k, c in enumerate(slot):
+                    self.totals[k] -= c
+                self.ring[self.head % len(self.ring)] = None
+
+    def add(self, kind, t, n=1):
+        """Count n events of kind (an index into kinds) at time t"""
+        self._roll(t)
+        i = self.head % len(self.ring)
+        slot = self.ring[i]
+        if slot is None:
+            slot = self.ring[i] = [0] * len(self.kinds)
+        slot[kind] += n
+        self.totals[kind] += n
+
+    def counts(self, t):
+        """Totals per kind within the window ending at t"""
+        self._roll(t)
+        return list(self.totals)
+
+class LogHistogram(object):
+    """Quantile sketch with bounded relative error (DDSketch-style): values
+    are counted in logarithmically sized buckets, so any quantile is
+    reported within accuracy of a value actually seen. Memory is bounded by
+    max_bins; beyond that the lowest buckets are merged, which only costs
+    accuracy for the smallest values. A heap of bucket keys finds the lowest
+    ones, so that costs O(log max_bins) per new bucket. Values <= 0 are
+    counted as 0."""
+    __slots__ = ('gamma', '_scale', 'max_bins', 'bins', 'keys', 'zeros', 'count')
+
+    def __init__(self, accuracy=0.02, max_bins=512):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._scale = 1 / math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins = {}
+        # heap of the keys of bins
+        self.keys = []
+        self.zeros = 0
+        self.count = 0
+
+    def _new_bin(self, k, c):
+        self.bins[k] = c
+        heapq.heappush(self.keys, k)
+        if len(self.bins) > self.max_bins:
+            low = heapq.heappop(self.keys)
+            self.bins[self.keys[0]] += self.bins.pop(low)
+
+    def add(self, x):
+        self.count += 1
+        if x <= 0:
+            self.zeros += 1
+            return
+        k = int(math.ceil(math.log(x) * self._scale))
+        bins = self.bins
+        if k in bins:
+            bins[k] += 1
+        else:
+            self._new_bin(k, 1)
+
+    def merge(self, other):
+        for k, c in other.bins.items():
+            if k in self.bins:
+                self.bins[k] += c
+            else:
+                self._new_bin(k, c)
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1), or None if empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if rank < seen:
+                return 2 * self.gamma ** k / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+class WindowSketch(object):
+    """LogHistogram of the values seen in roughly the last window seconds.
+    Values go into the histogram of the current half-window; queries merge
+    it with the previous one, so they cover between window/2 and window."""
+    __slots__ = ('half', 'epoch', 'cur', 'prev', '_args')
+
+    def __init__(self, window=3600, accuracy=0.02, max_bins=512):
+        self.half = window / 2
+        self._args = (accuracy, max_bins)
+        self.epoch = None
+        self.cur = LogHistogram(*self._args)
+        self.prev = None
+
+    def _roll(self, t):
+        epoch = int(t // self.half)
+        if self.epoch is None:
+            self.epoch = epoch
+        elif epoch > self.epoch:
+            self.prev = (self.cur if epoch == self.epoch + 1 else None)
+            self.cur = LogHistogram(*self._args)
+            self.epoch = epoch
+
+    def add(self, x, t):
+        self._roll(t)
+        self.cur.add(x)
+
+    def count(self, t):
+        self._roll(t)
+        return self.cur.count + (self.prev.count if self.prev else 0)
+
+    def quantile(self, q, t):
+        self._roll(t)
+        if self.prev is None:
+            return self.cur.quantile(q)
+        return LogHistogram(*self._args).merge(self.prev).merge(self.cur).quantile(q)
+
+def self_test(events=10**5, accuracy=0.02):
+    """Check quantile accuracy against exact quantiles and measure per-event
+    update cost of a WindowCounts plus a WindowSketch"""
+    import random
+    rng = random.Random(0)
+    values = [rng.lognormvariate(6, 2) for i in range(events)]
+    sketch = LogHistogram(accuracy)
+    for v in values:
+        sketch.add(v)
+    values.sort()
+    for q in (0.01, 0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        approx = sketch.quantile(q)
+        print('q=%.2f exact=%12.2f sketch=%12.2f' % (q, exact, approx))
+        assert abs(approx - exact) <= accuracy * exact * 1.0001, (q, exact, approx)
+    print('bins used: %s' % len(sketch.bins))
+    # at the bin cap, the lowest bins are merged; higher quantiles keep accuracy
+    capped = LogHistogram(accuracy, max_bins=len(sketch.bins) // 2)
+    t0 = time.time()
+    for v in rng.sample(values, len(values)):
+        capped.add(v)
+    print('update cost per event at the bin cap: %.2fus'
+            % ((time.time() - t0) / events * 1e6))
+    assert len(capped.bins) == capped.max_bins and sorted(capped.keys) == sorted(capped.bins)
+    assert sum(capped.bins.values()) + capped.zeros == events
+    assert capped.quantile(0.99) == sketch.quantile(0.99)
+
+    counts = WindowCounts(('a', 'b'), window=60)
+    rolling = WindowSketch(window=60)
+    t0 = time.time()
+    for i, v in enumerate(values):
+        t = i * 0.001
+        counts.add(i & 1, t)
+        rolling.add(v, t)
+    cost = (time.time() - t0) / events
+    print('update cost per event: %.2fus' % (cost * 1e6))
+    end = (events - 1) * 0.001
+    assert sum(counts.counts(end)) <= 60 / 0.001 + 1
+    assert counts.counts(end + 3600) == [0, 0]
+
+if __name__ == '__main__':
+    self_test()
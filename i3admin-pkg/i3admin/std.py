@@ -4,9 +4,14 @@ from __future__ import print_function
 import sys
 import os
 import time
-from itertools import chain, izip, tee, islice, count, groupby
+import heapq
+from itertools import chain, tee, islice, count, groupby
+try:
+    from itertools import imap, izip
+except ImportError:
+    imap, izip = map, zip
 from operator import itemgetter, eq
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, OrderedDict, deque
 from contextlib import contextmanager
 
 def bipart(seq, key=None, comp=None, arg=None):
@@ -68,11 +73,7 @@ def daemonize(target, *args, **kwargs):
 
 def _indent(line, char=' '):
     """Length of indentation by character char"""
-    if line.startswith(char):
-        for k,g in groupby(line):
-            return len(list(g))
-    else:
-        return 0
+    return len(line) - len(line.lstrip(char))
 
 def _parse_indent_tree_test():
     data = ("a\n"
@@ -84,36 +85,42 @@ def _parse_indent_tree_test():
             "    bb\n")
     root = parse_indent_tree(data.splitlines())
     print(root)
+    assert repr(root) == '__ROOT__\n' + data.rstrip('\n')
+    assert [t.depth for t in root.serialize()] == [0, 1, 2, 2, 1, 2, 3, 2]
 
 def parse_indent_tree(lines, tabstop=4):
-    root = cur = Tree('__ROOT__')
+    """Tree of lines (any iterable, consumed as it is read) in which lines
+    indented by tabstop spaces more than the previous one are its children"""
+    root = Tree('__ROOT__')
+    # stack[d] is the latest node of depth d
+    stack = [root]
     for l in lines:
         lvl = _indent(l)//tabstop + 1
+        assert lvl <= len(stack), "Indentation error at: " + l
+        del stack[lvl:]
         leaf = Tree(l.strip())
-        if lvl <= cur.depth:
-            while lvl < cur.depth:
-                cur = cur.parent
-            cur = cur.parent
-        elif lvl > cur.depth:
-            assert (lvl - cur.depth == 1), "Indentation error at: " + l
-        cur.add(leaf)
-        cur = leaf
+        stack[-1].add(leaf)
+        stack.append(leaf)
     return root
 
 
 class Tree(object):
+    __slots__ = ('obj', 'children', 'parent', 'depth')
+
     def __init__(self, obj):
         self.obj = obj
         self.children = []
         self.parent = self
+        self.depth = 0
 
     def add(self, tree):
         tree.parent = self
+        tree.depth = self.depth + 1
         self.children.append(tree)
-
-    @property
-    def depth(self):
-        return len(self.parents)
+        if tree.children:
+            for t in tree.walk():
+                if t is not tree:
+                    t.depth = t.parent.depth + 1
 
     @property
     def parents(self):
@@ -126,21 +133,26 @@ class Tree(object):
 
     @property
     def isroot(self):
-        return self.parent == self
+        return self.parent is self
+
+    def walk(self):
+        """self and its descendants, depth first, parents before children"""
+        stack = [self]
+        while stack:
+            t = stack.pop()
+            yield t
+            stack.extend(reversed(t.children))
+
+    def lines(self, tabstop=4):
+        """lines of repr(): str(obj) of walk(), indented by depth"""
+        for t in self.walk():
+            yield ' ' * tabstop * (t.depth - 1) + str(t.obj)
 
     def __repr__(self):
-        tabstop = 4
-        ret = ' ' * tabstop * (self.depth - 1)
-        #ret = ' ' * tabstop * (self.depth - 1)
-        #if not self.isroot:
-        #    ret += '\033[01;30m' + '^' + ('-' * (tabstop - 1)) + '\033[00m'
-        ret += str(self.obj)
-        if self.children:
-            ret += '\n' + '\n'.join(repr(c) for c in self.children)
-        return ret
+        return '\n'.join(self.lines())
 
     def serialize(self):
-        return [self] + flatten(c.serialize() for c in self.children)
+        return list(self.walk())
 
 
 def simple_xml_to_dict(parent_node):
@@ -263,84 +275,325 @@ def uniq(func, *args, **kwargs):
             yield cur
         prev = cur
 
+def _posix_monotonic():
+    """clock_gettime(CLOCK_MONOTONIC) through ctypes, for Pythons without
+    time.monotonic"""
+    import ctypes
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    try:
+        # in libc since glibc 2.17; looking up librt runs ldconfig
+        clock_gettime = ctypes.CDLL(None, use_errno=True).clock_gettime
+    except AttributeError:
+        import ctypes.util
+        clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt'),
+                                    use_errno=True).clock_gettime
+    # no argtypes: converting through them doubles the cost of a call
+    CLOCK_MONOTONIC = 1
+    ts = timespec()
+    ts_ref = ctypes.byref(ts)
+    def _monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ts_ref):
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return _monotonic
+
+_monotonic = getattr(time, 'monotonic', None)
+
+def monotonic():
+    """Seconds from a clock that never goes backwards or jumps with
+    wall-clock adjustments; only differences are meaningful"""
+    global _monotonic
+    if _monotonic is None:
+        _monotonic = _posix_monotonic()
+    return _monotonic()
+
 class ToleranceExceeded(Exception): 
     pass
 
+class ErrorStats(object):
+    """Running statistics of scheduling errors (seconds late; negative if
+    early) in constant memory: totals plus the <history> most recent values"""
+    def __init__(self, history=64):
+        self.count = 0
+        self.total = 0.0
+        self.maxabs = 0.0
+        self.recent = deque(maxlen=history)
+
+    def add(self, err):
+        self.count += 1
+        self.total += err
+        self.maxabs = max(self.maxabs, abs(err))
+        self.recent.append(err)
+
+    @property
+    def mean(self):
+        return (self.total / self.count if self.count else 0.0)
+
+    @property
+    def jitter(self):
+        """Mean absolute deviation of recent errors from their mean"""
+        if not self.recent:
+            return 0.0
+        avg = sum(self.recent) / len(self.recent)
+        return sum(abs(e - avg) for e in self.recent) / len(self.recent)
+
+    def __repr__(self):
+        return '<ErrorStats n=%d mean=%.6f max=%.6f jitter=%.6f>' % (
+                    self.count, self.mean, self.maxabs, self.jitter)
+
+def next_deadline(deadline, period, now):
+    """Next deadline on the deadline + n * period grid that is still ahead of
+    now; deadlines that have already passed are skipped rather than run in a
+    burst to catch up. For loops that wait on something else between
+    deadlines and so cannot be driven by Scheduler:
+
+    >>> deadline = monotonic()
+    >>> while True:
+    ...     if monotonic() >= deadline:
+    ...         deadline = next_deadline(deadline, 5, monotonic())
+    ...         refresh()
+    ...     handle(wait_for_input(timeout=deadline - monotonic()))
+    """
+    deadline += period
+    if deadline <= now:
+        deadline += period * (1 + int((now - deadline) // period))
+    return deadline
+
+class _Job(object):
+    __slots__ = ('period', 'func', 'args', 'kwargs', 'deadline', 'remaining',
+                    'stats', 'cancelled')
+
+    def __init__(self, period, func, args, kwargs, deadline, count, history):
+        self.period = period
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.remaining = count
+        self.stats = ErrorStats(history)
+        self.cancelled = False
+
+
 class Scheduler(object):
-    def __init__(self, tolerance=0.01):
-        self._period = None
-        self._timelog = []
+    """Periodic execution on a monotonic clock without drift: deadlines lie on
+    a fixed grid, so lateness of one call does not delay the following ones.
+
+    Single job, as a generator:
+    >>> for result in Scheduler().run(10, poll): ...
+    Single job, collecting results of func sampled between ticks:
+    >>> for samples in Scheduler().report(1, read_load, max_rate=20): ...
+    Several jobs multiplexed on one thread:
+    >>> sched = Scheduler()
+    >>> sched.add(1, poll_schedd)
+    >>> sched.add(60, rotate_logs)
+    >>> sched.loop()
+    """
+    def __init__(self, tolerance=0.01, history=64, clock=None):
+        self._clock = clock or monotonic
         self._tolerance = tolerance
+        self._history = history
+        self._period = None
+        self._start = None
+        self._deadline = None
+        self._scheduled = None
+        self._prev = None
+        self._last = None
+        self._ticks = 0
+        self._heap = []
+        self._seq = count()
+        # asyncio event loop driving the jobs after attach(), and the
+        # offset of its clock from ours
+        self._loop = None
+        self._offset = 0
+        self.stats = ErrorStats(history)
+
+    def _reset(self, rate):
+        self._period = 1/float(rate)
+        self._start = self._deadline = self._scheduled = None
+        self._prev = self._last = None
+        self._ticks = 0
+        self.stats = ErrorStats(self._history)
+
+    def _tick(self, now):
+        if self._start is None:
+            self._start = self._deadline = now
+        self._prev, self._last = self._last, now
+        self._scheduled = self._deadline
+        self._deadline = next_deadline(self._deadline, self._period, now)
+        self._ticks += 1
+        self.stats.add(self.late)
 
     @property
     def dt(self):
-        return self._timelog[-1] - self._timelog[-2]
+        return self._last - self._prev
 
     @property
     def toterr(self):
-        last_act = self._timelog[-1] - self._timelog[0]
-        last_exp = (len(self._timelog)-1) * self._period
-        return last_act - last_exp
+        """Cumulative drift: time from the first tick to the last minus the
+        time that many ticks should take; deadlines skipped because a call
+        overran count as drift, as they did before ticks were skipped"""
+        return self._last - self._start - (self._ticks - 1) * self._period
+
+    @property
+    def late(self):
+        """How late the last tick was relative to its deadline; what stats
+        collects"""
+        return self._last - self._scheduled
 
     @property
     def wait(self):
-        try:
-            elapsed = time.time() - self._timelog[-1]
-            return self._period - elapsed - self.toterr
-        except IndexError:
+        """Seconds until the next deadline"""
+        if self._deadline is None:
             return 0
+        return max(0, self._deadline - self._clock())
 
     @property
     def err(self):
-        return abs(self.dt - self._period) / self._period 
+        return abs(self.dt - self._period) / self._period
 
     def run(self, rate, func, count=float('inf'), args=(), kwargs=None):
+        """Call func rate times per second; yield its results. Stops if
+        sleep() raises IOError (python 2)"""
         kwargs = kwargs or {}
-        self._period = 1/float(rate)
-        self._timelog = []
+        self._reset(rate)
         while True:
-            try:
-                time.sleep(self.wait)
-            except IOError:
-                break
-            self._timelog.append(time.time())
+            while self.wait > 0:
+                try:
+                    time.sleep(self.wait)
+                except IOError:
+                    # python 2's sleep() raises IOError where it cannot
+                    # sleep; stop, as run() always has (a sleep cut short
+                    # by a signal just waits again)
+                    return
+            self._tick(self._clock())
             yield func(*args, **kwargs)
-            if len(self._timelog) >= count:
+            if self._ticks >= count:
                 return
 
-    def report(self, rate, func, count=float('inf'), args=(), kwargs=None):
+    def report(self, rate, func, count=float('inf'), args=(), kwargs=None,
+                max_rate=100):
+        """Every 1/rate seconds yield the list of results of calling func
+        in the meantime, at most max_rate times per second (0: as often as
+        possible)"""
         kwargs = kwargs or {}
-        self._period = 1/float(rate)
-        self._timelog = [time.time()]
+        self._reset(rate)
+        sample_period = (1/float(max_rate) if max_rate else 0)
+        self._tick(self._clock())
         while True:
             hist = []
-            while self.wait > 0:
-                hist.append(func(*args, **kwargs))
-            self._timelog.append(time.time())
+            deadline = self._deadline
+            next_sample = self._clock()
+            while True:
+                now = self._clock()
+                if now >= deadline:
+                    break
+                if now >= next_sample:
+                    hist.append(func(*args, **kwargs))
+                    # a slow func skips samples rather than running them back to back
+                    next_sample = (next_deadline(next_sample, sample_period, self._clock())
+                                    if sample_period else self._clock())
+                time.sleep(max(0, min(next_sample, deadline) - self._clock()))
+            self._tick(self._clock())
             if self.err > self._tolerance:
                 raise ToleranceExceeded(self.err)
             yield hist
-            if len(self._timelog) -1 >= count:
+            if self._ticks - 1 >= count:
+                return
+
+    def add(self, period, func, args=(), kwargs=None, count=float('inf'), delay=0):
+        """Schedule func every period seconds, first after delay; returns a
+        job handle for cancel(). Jobs run when loop() or attach() drives them;
+        after attach(), call add() from the event loop's thread"""
+        job = _Job(period, func, args, kwargs or {}, self._clock() + delay, count,
+                    self._history)
+        if self._loop is not None:
+            self._call_at(job)
+        else:
+            heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+        return job
+
+    def cancel(self, job):
+        job.cancelled = True
+
+    def _run_job(self, job, now):
+        job.stats.add(now - job.deadline)
+        job.func(*job.args, **job.kwargs)
+        job.remaining -= 1
+        job.deadline = next_deadline(job.deadline, job.period, self._clock())
+
+    def loop(self, duration=None):
+        """Run added jobs until none are left (or for duration seconds)"""
+        until = (self._clock() + duration if duration is not None else None)
+        while self._heap:
+            deadline, seq, job = self._heap[0]
+            if job.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            now = self._clock()
+            if until is not None and min(deadline, until) == until:
+                time.sleep(max(0, until - now))
                 return
+            if now < deadline:
+                time.sleep(deadline - now)
+                continue
+            heapq.heappop(self._heap)
+            self._run_job(job, now)
+            if job.remaining > 0 and not job.cancelled:
+                heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+
+    def attach(self, loop):
+        """Drive jobs added so far and later from an asyncio event loop
+        instead of loop(). Deadlines are converted to loop.time(), which is
+        monotonic."""
+        self._loop = loop
+        self._offset = loop.time() - self._clock()
+        while self._heap:
+            deadline, seq, job = heapq.heappop(self._heap)
+            self._call_at(job)
+
+    def _call_at(self, job):
+        self._loop.call_at(job.deadline + self._offset, self._fire, job)
+
+    def _fire(self, job):
+        if job.cancelled:
+            return
+        self._run_job(job, self._loop.time() - self._offset)
+        if job.remaining > 0 and not job.cancelled:
+            self._call_at(job)
 
     @classmethod
-    def self_test(cls):
-        print('"Run every" mode test:')
-        cnt = count()
+    def self_benchmark(cls, seconds=2.0, rate=100):
+        """Measure CPU overhead and timing jitter of each mode"""
+        def cpu():
+            return sum(os.times()[:2])
+        def line(mode, stats, wall, used):
+            print('%-12s calls=%-6d late: mean=%7.1fus max=%7.1fus jitter=%7.1fus '
+                    'cpu=%5.2f%%' % (mode, stats.count, stats.mean * 1e6,
+                    stats.maxabs * 1e6, stats.jitter * 1e6, 100 * used / wall))
+
         sched = cls()
-        err = []
-        for v in sched.run(10, cnt.next):
-            err.append(sched.toterr)
-            if v > 10:
-                print('\t', len(err), sum(err)/float(len(err)), max(err))
-                break
-
-        print('"Run between" mode test')
-        cnt = count()
+        c0, t0 = cpu(), monotonic()
+        for v in sched.run(rate, int, count=int(seconds * rate)):
+            pass
+        line('run', sched.stats, monotonic() - t0, cpu() - c0)
+
+        sched = cls(tolerance=1)
+        c0, t0 = cpu(), monotonic()
+        samples = 0
+        for hist in sched.report(10, int, count=int(seconds * 10), max_rate=rate):
+            samples += len(hist)
+        line('report', sched.stats, monotonic() - t0, cpu() - c0)
+        print('%-12s samples=%d (bound %d)' % ('', samples, seconds * rate))
+
         sched = cls()
-        for v in sched.report(10, cnt.next):
-            print('\t', len(v), sched.toterr)
-            break
+        jobs = [sched.add(1/float(r), int) for r in (rate, rate/2, rate/10)]
+        c0, t0 = cpu(), monotonic()
+        sched.loop(seconds)
+        wall, used = monotonic() - t0, cpu() - c0
+        for r, job in zip((rate, rate/2, rate/10), jobs):
+            line('loop %gHz' % r, job.stats, wall, used)
 
 def take(n, iterable):
     "Return first n items of the iterable as a list"
@@ -385,9 +638,10 @@ class NonBlockingConsole(object):
         import termios
         termios.tcsetattr(sys.stdin, termios.TCSADRAIN, self.old_settings)
 
-    def get_data(self):
+    def get_data(self, timeout=0):
+        """Return a character, waiting for up to timeout seconds"""
         import select
-        if select.select([sys.stdin], [], [], 0) == ([sys.stdin], [], []):
+        if select.select([sys.stdin], [], [], timeout) == ([sys.stdin], [], []):
             return sys.stdin.read(1)
         return False
 
@@ -451,39 +705,163 @@ def least_sq_line(xs, ys):
 def expandpaths(*paths):
     """sorted names of regular files in paths union files of trees of 
     directories in paths"""
-    filenames = []
+    filenames = set()
     for p in paths:
         if os.path.isdir(p):
-            filenames.extend(walkpath(p))
+            filenames.update(walkpath(p))
         else:
-            filenames.append(p)
-    return list(sorted(set(filenames)))
-
-def walkpath(path):
-    """names of regular files in tree rooted at path"""
-    filelist = []
-    for root, dirs, files in os.walk(path):
-        filelist.extend(os.path.join(root, f) for f in files)
-    return filelist
-
-def dup_files(filelist, size=-1):
-    """find files in filelist with identical content of first <size> bytes"""
-    _content_ = itemgetter(0)
-    _file_ = itemgetter(1)
-    fcontents = sorted( (f.read(size), f.name) for f in imap(open, filelist))
-    dupfiles = [ list(g) for k,g in groupby(fcontents, _content_)]
-    dupfiles = ( map(_file_, g) for g in dupfiles if len(g) > 1)
-    return dupfiles
-
-def profile_main(stat_lines=18):
+            filenames.add(p)
+    return sorted(filenames)
+
+def _scandir():
+    """os.scandir, or the scandir backport, or None"""
+    try:
+        return os.scandir
+    except AttributeError:
+        try:
+            from scandir import scandir
+            return scandir
+        except ImportError:
+            return None
+
+def _scan(path, scandir=None):
+    """(files, subdirectories) of directory path, like one step of os.walk:
+    symlinks to directories are listed as neither, unreadable directories
+    as empty"""
+    files, dirs = [], []
+    try:
+        if scandir is not None:
+            for entry in scandir(path):
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif not entry.is_dir():
+                    files.append(entry.path)
+        else:
+            for name in os.listdir(path):
+                name = os.path.join(path, name)
+                if os.path.isdir(name):
+                    if not os.path.islink(name):
+                        dirs.append(name)
+                else:
+                    files.append(name)
+    except OSError:
+        pass
+    return files, dirs
+
+def walkpath(path, workers=None):
+    """names of regular files in tree rooted at path, generated as
+    directories are read; with workers, read up to that many directories
+    at a time in threads (useful on network file systems)"""
+    scandir = _scandir()
+    if not workers:
+        stack = [path]
+        while stack:
+            files, dirs = _scan(stack.pop(), scandir)
+            for f in files:
+                yield f
+            stack.extend(reversed(dirs))
+        return
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(workers)
+    try:
+        level = [path]
+        while level:
+            next_level = []
+            for files, dirs in pool.imap_unordered(lambda d: _scan(d, scandir), level):
+                for f in files:
+                    yield f
+                next_level.extend(dirs)
+            level = next_level
+    finally:
+        pool.terminate()
+
+def _file_hash(job):
+    """sha1 of bytes [start, stop) of file name, read chunk bytes at a
+    time, for job (name, start, stop, chunk); None if it cannot be read"""
+    import hashlib
+    name, start, stop, chunk = job
+    digest = hashlib.sha1()
+    try:
+        with open(name, 'rb') as f:
+            f.seek(start)
+            left = stop - start
+            while left > 0:
+                data = f.read(min(chunk, left))
+                if not data:
+                    break
+                digest.update(data)
+                left -= len(data)
+    except (IOError, OSError):
+        return None
+    return digest.digest()
+
+def _refine(groups, start, stop, chunk, pool):
+    """split lists of names of files of equal length in groups [(length,
+    names)] by the hash of bytes [start, min(stop, length)) of each file,
+    keeping lists of two or more"""
+    jobs = [(n, start, min(stop, length), chunk) for length, names in groups for n in names]
+    hashes = (pool.imap(_file_hash, jobs, 16) if pool else imap(_file_hash, jobs))
+    hashes = dict(izip((job[0] for job in jobs), hashes))
+    refined = []
+    for length, names in groups:
+        by_hash = defaultdict(list)
+        for n in names:
+            if hashes[n] is not None:
+                by_hash[hashes[n]].append(n)
+        refined.extend((length, sub) for sub in by_hash.values() if len(sub) > 1)
+    return refined
+
+def dup_files(filelist, size=-1, workers=4, head=1 << 16, chunk=1 << 20):
+    """find files in filelist with identical content of first <size> bytes
+    (all of it if size is -1); generates sorted lists of names.
+
+    Only files of the same (size-limited) length are compared, first by a
+    hash of their first head bytes and then by a hash of the rest, read in
+    chunks of chunk bytes by up to workers threads, so that memory use
+    does not depend on file sizes. Files that cannot be read are skipped."""
+    by_size = defaultdict(list)
+    for name in filelist:
+        try:
+            length = os.stat(name).st_size
+        except OSError:
+            continue
+        by_size[length if size < 0 else min(length, size)].append(name)
+    groups = [(length, names) for length, names in by_size.items() if len(names) > 1]
+    del by_size
+    pool = None
+    if workers and workers > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+    try:
+        groups = _refine(groups, 0, head, chunk, pool)
+        groups = ([g for g in groups if g[0] <= head]
+                    + _refine([g for g in groups if g[0] > head], head, float('inf'),
+                                chunk, pool))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    for names in sorted(sorted(names) for length, names in groups):
+        yield names
+
+
+def profile_main(stat_lines=18, profname=None, main=None):
+    """Run main (default: main() of the __main__ module) under cProfile;
+    save pstats to profname (default: program name + .prof), print the top
+    stat_lines and return what main returned"""
     import cProfile, pstats
-    from term import incolor
+    from i3admin.term import incolor
     sys.stderr.write(incolor('PROFILING', 'cyan', 'red', 'blink'))
     sys.stderr.write('\n')
     sys.stderr.flush()
-    profname = sys.argv[0] + '.prof'
-    cProfile.run('main()', profname)
-    pstats.Stats(profname).strip_dirs().sort_stats('time').print_stats(stat_lines)
+    profname = profname or sys.argv[0] + '.prof'
+    if main is None:
+        main = sys.modules['__main__'].main
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(main)
+    finally:
+        profiler.dump_stats(profname)
+        pstats.Stats(profname).strip_dirs().sort_stats('time').print_stats(stat_lines)
 
 def send_email(subject, body, to, sender=None, cc=[], server="mail"):
     import email.mime.text, smtplib, socket, time
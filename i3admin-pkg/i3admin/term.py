@@ -2,9 +2,7 @@
 """ANSI terminal text color, formatting, etc."""
 from __future__ import print_function
 import os
-import string
 import sys
-from pprint import pprint
 from collections import namedtuple
 
 """
@@ -16,8 +14,48 @@ http://docs.python.org/howto/curses.html
 alternative: http://nadiana.com/python-curses-terminal-controller
 """
 
-termwidth = int(os.popen('tput cols', 'r').read())
-termheight = int(os.popen('tput lines', 'r').read())
+def termsize(fallback=(80, 24)):
+    """(columns, lines) of the terminal; checked on every call, so it follows
+    window resizes. Honors COLUMNS and LINES like shutil.get_terminal_size"""
+    try:
+        from shutil import get_terminal_size
+        return tuple(get_terminal_size(fallback))
+    except ImportError:
+        pass
+    import fcntl, struct, termios
+    try:
+        cols, lines = int(os.environ['COLUMNS']), int(os.environ['LINES'])
+        if cols > 0 and lines > 0:
+            return cols, lines
+    except (KeyError, ValueError):
+        pass
+    for fd in (sys.__stdout__, sys.__stderr__, sys.__stdin__):
+        try:
+            packed = fcntl.ioctl(fd.fileno(), termios.TIOCGWINSZ, '\0' * 8)
+            lines, cols = struct.unpack('hhhh', packed)[:2]
+            if cols > 0 and lines > 0:
+                return cols, lines
+        except (AttributeError, IOError, ValueError):
+            continue
+    return fallback
+
+def get_termwidth():
+    return termsize()[0]
+
+def get_termheight():
+    return termsize()[1]
+
+# termwidth and termheight are ints sized once, as they always were; use
+# get_termwidth()/get_termheight() to follow window resizes. Where modules
+# support __getattr__ (python 3.7+) they are probed on first use
+def __getattr__(name):
+    if name in ('termwidth', 'termheight'):
+        globals()['termwidth'], globals()['termheight'] = termsize()
+        return globals()[name]
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+if sys.version_info < (3, 7):
+    termwidth, termheight = termsize()
 
 def columns(*args, **kwargs):
     sep = kwargs.get('sep') or ''
@@ -133,6 +171,59 @@ def vga(text, color):
     """256-color text"""
     return '\033[38;5;%dm%s\033[0m' % (color, str(text))
 
+class Screen(object):
+    """Full-screen display that repaints only the lines that changed since
+    the previous frame:
+    >>> with Screen() as scr:
+    >>>     while True:
+    >>>         scr.update(make_lines())
+    Lines longer than the terminal are truncated by the terminal (autowrap is
+    turned off); lines below the bottom of the terminal are dropped."""
+    enter = '\033[?1049h\033[?25l\033[?7l\033[H\033[2J'
+    leave = '\033[?7h\033[?25h\033[?1049l'
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.lines = []
+        self.size = None
+
+    def __enter__(self):
+        self.out.write(self.enter)
+        self.out.flush()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.out.write(self.leave)
+        self.out.flush()
+
+    def update(self, lines):
+        """Draw lines; return (number of lines rewritten, bytes written)"""
+        size = termsize()
+        lines = lines[:size[1]]
+        buf = []
+        if size != self.size:
+            buf.append('\033[H\033[2J')
+            self.lines = []
+            self.size = size
+        changed = 0
+        for row, line in enumerate(lines):
+            if row >= len(self.lines) or self.lines[row] != line:
+                buf.append('\033[%d;1H%s\033[0m\033[K' % (row + 1, line))
+                changed += 1
+        for row in range(len(lines), len(self.lines)):
+            buf.append('\033[%d;1H\033[K' % (row + 1))
+            changed += 1
+        self.lines = lines
+        data = ''.join(buf)
+        self.out.write(data)
+        self.out.flush()
+        return changed, len(data)
+
+    @staticmethod
+    def full_redraw_size(lines):
+        """Bytes a clear-and-repaint of lines would write, for comparison"""
+        return len('\033[H\033[2J') + sum(len(l) + len('\033[0m\n') for l in lines)
+
 if __name__ == '__main__':
     separator = '-' * 79
     print('Terminal type: ', os.getenv('TERM'))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""Named phase timers and counters for command line tools.
+
+    Timer = PhaseTimer()
+    ...
+    with Timer.phase('query'):
+        ads = schedd.query()
+    Timer.count('ads', len(ads))
+
+Phases nest; time spent in a nested phase is not charged to the enclosing
+one, so phase times add up to the time spent in all phases. A disabled
+timer hands out a shared no-op context manager, which keeps instrumented
+hot loops within a few hundred nanoseconds of uninstrumented ones.
+"""
+from __future__ import division
+from __future__ import print_function
+import argparse
+import sys
+from collections import OrderedDict
+from i3admin.std import monotonic as _clock
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+_null_phase = _NullPhase()
+
+class _Phase(object):
+    __slots__ = ('timer', 'name')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer._stack.append([self.name, _clock(), 0.0])
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.timer._pop()
+        return False
+
+class PhaseTimer(object):
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.times = OrderedDict()
+        self.calls = OrderedDict()
+        self.counters = OrderedDict()
+        self.output = None
+        self.json_output = None
+        self._stack = []
+        # the clock is not read unless enabled: on py2 that loads ctypes
+        self._start = _clock() if enabled else None
+
+    def configure(self, opts):
+        """Enable according to --timings/--timings-json (see add_timing_arguments)"""
+        self.output = (sys.stderr if opts.timings else None)
+        self.json_output = opts.timings_json
+        self.enabled = bool(self.output or self.json_output)
+        self._start = _clock() if self.enabled else None
+        return self
+
+    def phase(self, name):
+        if not self.enabled:
+            return _null_phase
+        return _Phase(self, name)
+
+    def _pop(self):
+        name, start, nested = self._stack.pop()
+        elapsed = _clock() - start
+        self.times[name] = self.times.get(name, 0.0) + elapsed - nested
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def iter(self, counter, iterable, phase='query'):
+        """Charge the time spent producing items of iterable to phase and
+        count the items; e.g. Timer.iter('ads', schedd.xquery())"""
+        if not self.enabled:
+            return iterable
+        return self._iter(counter, iterable, phase)
+
+    def _iter(self, counter, iterable, phase):
+        it = iter(iterable)
+        while True:
+            with self.phase(phase):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            self.count(counter)
+            yield item
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        wall = _clock() - self._start
+        return OrderedDict([
+                    ('wall', round(wall, 6)),
+                    ('phases', OrderedDict((k, {'time': round(v, 6), 'calls': self.calls[k]})
+                                                for k,v in self.times.items())),
+                    ('counters', self.counters)])
+
+    def summary(self):
+        stats = self.as_dict()
+        wall = stats['wall'] or float('nan')
+        lines = ['%-10s %8s %10s %6s' % ('PHASE', 'CALLS', 'TIME', '%')]
+        for name, ph in stats['phases'].items():
+            lines.append('%-10s %8d %9.3fs %5.1f%%'
+                            % (name, ph['calls'], ph['time'], 100 * ph['time'] / wall))
+        other = wall - sum(self.times.values())
+        lines.append('%-10s %8s %9.3fs %5.1f%%' % ('(other)', '', other, 100 * other / wall))
+        lines.append('%-10s %8s %9.3fs' % ('total', '', stats['wall']))
+        if self.counters:
+            lines.append('  '.join('%s=%s' % kv for kv in self.counters.items()))
+        return '\n'.join(lines)
+
+    def report(self):
+        if not self.enabled:
+            return
+        if self.output:
+            print(self.summary(), file=self.output)
+        import json
+        if self.json_output == '-':
+            print(json.dumps(self.as_dict()), file=sys.stderr)
+        elif self.json_output:
+            with open(self.json_output, 'w') as f:
+                json.dump(self.as_dict(), f)
+                f.write('\n')
+
+    @classmethod
+    def self_test(cls, loops=10**6, budget=2e-6):
+        """Measure per-call overhead of disabled instrumentation; raise
+        AssertionError if it exceeds budget seconds"""
+        timer = cls(enabled=False)
+        t0 = _clock()
+        for i in range(loops):
+            pass
+        bare = _clock() - t0
+        t0 = _clock()
+        for i in range(loops):
+            with timer.phase('render'):
+                pass
+            timer.count('rows')
+        disabled = _clock() - t0
+        overhead = (disabled - bare) / loops
+        print('disabled overhead per phase+count: %.0fns' % (overhead * 1e9))
+        assert overhead < budget, overhead
+
+        timer = cls(enabled=True)
+        t0 = _clock()
+        for i in range(loops // 10):
+            with timer.phase('outer'):
+                with timer.phase('inner'):
+                    pass
+        enabled = (_clock() - t0) / (loops // 10)
+        print('enabled cost per nested phase pair: %.0fns' % (enabled * 1e9))
+        print(timer.summary())
+
+def add_timing_arguments(parser):
+    g = parser.add_argument_group('instrumentation')
+    g.add_argument('--timings', default=False, action='store_true',
+            help='print time spent in each phase to stderr on exit')
+    g.add_argument('--timings-json', metavar='PATH', nargs='?', const='-',
+            help='write phase timings as JSON to PATH (stderr if omitted)')
+    g.add_argument('--profile', metavar='PATH', nargs='?', const='',
+            help='run under cProfile and save pstats to PATH '
+                 '(default: program name + .prof)')
+    return g
+
+def run_main(main, timer=None):
+    """Run main(), under the profiler if --profile was given, and report
+    timer on the way out (also on KeyboardInterrupt)"""
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument('--profile', nargs='?', const='')
+    opts, _ = pre.parse_known_args()
+    try:
+        if opts.profile is None:
+            return main()
+        else:
+            from i3admin.std import profile_main
+            return profile_main(profname=opts.profile or None, main=main)
+    finally:
+        if timer is not None:
+            timer.report()
+
+if __name__ == '__main__':
+    PhaseTimer.self_test()
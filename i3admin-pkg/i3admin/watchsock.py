@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""Unix socket protocol of the condor_watch queue service.
+
+A client sends one JSON line describing the query:
+
+    {"where": {"owner": ["vbrik"], "status": [1, 2], "group": ["!<none>"]},
+     "constraint": "RequestGpus > 0",
+     "projection": ["ClusterId", "ProcId", "Owner"]}
+
+"where" fields are answered from secondary indexes of the server: values of
+a field are OR-ed, fields are AND-ed, and values prefixed with ! exclude.
+Jobs without AccountingGroup are in group "<none>". The optional ClassAd
+"constraint" is evaluated only on jobs selected by "where".
+
+The server answers with frames, each a 4-byte big-endian length followed by
+that many bytes of JSON: {"attrs": [...]} first, then lists of rows (one
+value per projected attribute, null if undefined), and finally an empty
+frame. A failed query is answered with a single {"error": "..."} frame.
+"""
+from __future__ import division
+from __future__ import print_function
+import os
+import struct
+import sys
+
+# where fields and the job attributes they index
+Fields = {
+    'owner': 'Owner',
+    'group': 'AccountingGroup',
+    'status': 'JobStatus',
+    'universe': 'JobUniverse',
+    'cluster': 'ClusterId',
+    # not indexed by condor_watch; for where_constraint() and where_filter()
+    'proc': 'ProcId',
+}
+
+_header = struct.Struct('!I')
+
+def job_group(accounting_group):
+    """Group part of AccountingGroup, as condor_jobs and condor_dashboard
+    show it"""
+    if accounting_group is None:
+        return '<none>'
+    return str(accounting_group).split('.')[0]
+
+def split_values(values):
+    """(included, excluded) values of a where field; numeric strings are
+    converted to int so that "!7" excludes 7"""
+    inc, exc = [], []
+    for v in values:
+        target = inc
+        if isinstance(v, type(u'')) or isinstance(v, str):
+            v = str(v)
+            if v.startswith('!'):
+                v = v[1:]
+                target = exc
+            try:
+                v = int(v)
+            except ValueError:
+                pass
+        target.append(v)
+    return inc, exc
+
+def trivial_constraint(constraint):
+    """Whether constraint selects every job (empty, TRUE or (TRUE)), as
+    i3admin.history decides it"""
+    return not constraint or constraint.strip().lower() in ('true', '(true)')
+
+def where_constraint(where, constraint=None):
+    """ClassAd constraint equivalent to where and constraint, for querying
+    condor_schedd directly; written the way condor_jobs and condor_dashboard
+    wrote their constraints before the queue service (JobUniverse == 5,
+    JobUniverse != 7, regexp("^group\\.", AccountingGroup)). Numeric where
+    fields are attributes every job ad defines, so == and != match the
+    server's indexes; strings are compared case-sensitively, like the
+    indexes."""
+    conjuncts = []
+    for field in sorted(where or {}):
+        attr = Fields[field]
+        inc, exc = split_values(where[field])
+        def test(value, negate):
+            if field == 'group':
+                if value == '<none>':
+                    return '%s %s UNDEFINED' % (attr, '=!=' if negate else '=?=')
+                expr = 'regexp("^%s\\.", %s)' % (value, attr)
+                return (expr + ' =!= True' if negate else expr)
+            if isinstance(value, int):
+                return '%s %s %s' % (attr, '!=' if negate else '==', value)
+            return '%s %s "%s"' % (attr, '=!=' if negate else '=?=', value)
+        if inc:
+            tests = [test(v, False) for v in inc]
+            conjuncts.append(tests[0] if len(tests) == 1 else '(%s)' % ' || '.join(tests))
+        conjuncts.extend(test(v, True) for v in exc)
+    if not trivial_constraint(constraint):
+        conjuncts.append('(%s)' % constraint)
+    return ' && '.join(conjuncts) or 'TRUE'
+
+def where_filter(where):
+    """Predicate on job ads (dicts) equivalent to where_constraint(where)"""
+    tests = []
+    for field, values in (where or {}).items():
+        inc, exc = split_values(values)
+        tests.append((Fields[field], field == 'group', set(inc), set(exc)))
+    def match(ad):
+        for attr, group, inc, exc in tests:
+            value = ad.get(attr)
+            if group:
+                value = job_group(value)
+            if (inc and value not in inc) or value in exc:
+                return False
+        return True
+    return match
+
+def send_frame(sock, obj):
+    import json
+    data = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    sock.sendall(_header.pack(len(data)) + data)
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise IOError('connection closed by condor_watch')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+if str is bytes:
+    def _ads(attrs, rows):
+        """Dicts of rows, without undefined values; strings are made str,
+        since the json module of python 2 returns unicode"""
+        for row in rows:
+            yield dict([(a, (v.encode('utf-8') if type(v) is unicode else v))
+                            for a, v in zip(attrs, row) if v is not None])
+else:
+    def _ads(attrs, rows):
+        """Dicts of rows, without undefined values"""
+        for row in rows:
+            yield dict([(a, v) for a, v in zip(attrs, row) if v is not None])
+
+def query(path, where=None, constraint=None, projection=None, timeout=60):
+    """Query the condor_watch queue service listening on path; yield job
+    ads as dicts without undefined attributes, like Schedd.xquery()"""
+    import json
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        request = {'where': where or {}, 'constraint': constraint,
+                    'projection': list(projection or [])}
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        attrs = None
+        while True:
+            size, = _header.unpack(_recv_exactly(sock, _header.size))
+            if not size:
+                return
+            frame = json.loads(_recv_exactly(sock, size).decode('utf-8'))
+            if isinstance(frame, dict):
+                if 'error' in frame:
+                    raise RuntimeError('condor_watch: %s' % frame['error'])
+                attrs = [str(a) for a in frame['attrs']]
+                continue
+            for ad in _ads(attrs, frame):
+                yield ad
+    finally:
+        sock.close()
+
+class Server(object):
+    """Accept connections on a Unix socket at path and answer each in its
+    own thread with handler(request), which returns attrs and an iterable
+    of lists of rows, each sent as a frame"""
+
+    def __init__(self, path, handler):
+        import socket
+        self.path = path
+        self.handler = handler
+        if os.path.exists(path):
+            # refuse to take over a socket somebody is still listening on
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                os.unlink(path)
+            else:
+                raise IOError('%s is in use' % path)
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(16)
+
+    def start(self):
+        import threading
+        thread = threading.Thread(target=self._accept_loop, name='watchsock')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _accept_loop(self):
+        import threading
+        while True:
+            conn, _ = self.sock.accept()
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        import json
+        import socket
+        try:
+            fobj = conn.makefile('rb')
+            request = json.loads(fobj.readline().decode('utf-8'))
+            fobj.close()
+            try:
+                attrs, batches = self.handler(request)
+            except Exception as e:
+                send_frame(conn, {'error': '%s: %s' % (e.__class__.__name__, e)})
+                return
+            send_frame(conn, {'attrs': attrs})
+            for rows in batches:
+                send_frame(conn, rows)
+            conn.sendall(_header.pack(0))
+        except (IOError, ValueError, socket.error) as e:
+            print('watchsock: %s' % e, file=sys.stderr)
+        finally:
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass